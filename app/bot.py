@@ -1,25 +1,64 @@
+from .startup import STARTUP  # первым: замер времени запуска включает все импорты ниже
+
 import os
+import time
 import asyncio
+import logging
+import argparse
+from functools import partial
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import CommandStart
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.client.default import DefaultBotProperties
-from aiogram.types import FSInputFile
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from dotenv import load_dotenv
 
+STARTUP.mark("import aiogram")
+
+# .env — до импорта модулей приложения: часть из них читает окружение при импорте
+# (SENDER в app/sender.py, манифест медиа при загрузке колоды)
+load_dotenv()
+STARTUP.mark("load .env")
+
 from .keyboards import MAIN_MENU, SPREADS_KB, preview_kb, final_kb
 from .spreads import SPREAD_BY_ID
 from .deck import draw_cards
-from .utils import md_escape, render_cards_md, rounded_image_path
-from .llm import build_interpretation
+from .utils import md_escape, render_cards_md
+from .render import rounded_image_path_async, shutdown_executor
+from .llm import DEGRADED_SUMMARY, build_interpretation, close_http_client
+from .metrics import READING_SECONDS, READINGS_TOTAL, fsm_sessions_gauge, start_metrics_server
+from .file_ids import answer_photo_cached
+from .reveal import RevealItem, reveal_cards
+from .live_message import LiveMessage
+from .readings import READINGS
+from .sender import send
+from .fsm_storage import build_storage
+from .media_manifest import get_media, report_missing_assets
+from .tracing import PROFILER, admin_ids, arm_from_env, span, start_trace
+
+STARTUP.mark("import app modules + deck/media")
+
+logger = logging.getLogger(__name__)
 
 # ---- Инициализация окружения ----
-load_dotenv()
+# TG_BOT_TOKEN  = токен бота
+# TG_API_SERVER = свой сервер Bot API, например http://localhost:8081 (по умолчанию api.telegram.org)
+# Тяжёлые модули (Pillow, httpx, aiohttp-сервер вебхука) грузятся при первом использовании.
 TOKEN = os.getenv("TG_BOT_TOKEN")
 
 # ---- Диспетчер ----
-dp = Dispatcher()
+# Состояния диалогов переживают перезапуск (см. FSM_STORAGE в app/fsm_storage.py)
+dp = Dispatcher(storage=build_storage())
+fsm_sessions_gauge(dp.storage)
+STARTUP.mark("dispatcher + FSM storage")
+
+
+def make_bot() -> Bot:
+    api_server = os.getenv("TG_API_SERVER", "").strip().rstrip("/")
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_server)) if api_server else None
+    return Bot(TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
 
 
 # ---- Состояния ----
@@ -73,6 +112,22 @@ async def on_ask(cb: types.CallbackQuery, state: FSMContext):
     await cb.answer()
 
 
+def _from_admin(msg: types.Message) -> bool:
+    return msg.from_user is not None and msg.from_user.id in admin_ids()
+
+
+# Служебная команда: /profile N — cProfile на ближайшие N раскладов (только для ADMIN_IDS).
+# Фильтр, а не проверка внутри: у остальных «/profile» проходит дальше — например, как вопрос.
+@dp.message(Command("profile"), _from_admin)
+async def on_profile(msg: types.Message, command: CommandObject):
+    arg = (command.args or "").strip()
+    n = int(arg) if arg.isdigit() else 1
+    if PROFILER.arm(n):
+        await msg.answer(f"Профилирую следующие {n} раскладов. Отчёт появится в PROFILE_DIR.")
+    else:
+        await msg.answer("Профилировщик уже запущен — дождитесь отчёта.")
+
+
 @dp.message(Form.waiting_question)
 async def on_question(msg: types.Message, state: FSMContext):
     question = (msg.text or "").strip()
@@ -88,32 +143,32 @@ async def on_spread(cb: types.CallbackQuery, state: FSMContext):
     await state.update_data(spread_id=spread_id)
 
     # Пробуем отправить схему расклада как изображение
-    scheme_path = None
-    for ext in ("png", "jpg", "jpeg"):
-        p = os.path.join("media", "spreads", f"{spread_id}.{ext}")
-        if os.path.exists(p):
-            scheme_path = p
-            break
+    scheme_path = get_media().find("spreads", spread_id)
 
     caption = f"<b>{spread.title}</b>\n\nПозиции: " + ", ".join(spread.positions)
 
+    chat_id = cb.message.chat.id
     if scheme_path:
         try:
-            await cb.message.answer_photo(
-                FSInputFile(scheme_path),
+            await send(chat_id, partial(
+                answer_photo_cached,
+                cb.message,
+                scheme_path,
                 caption=caption + "\n\nВыберите действие:",
                 reply_markup=preview_kb(spread_id),
-            )
+            ))
         except Exception:
-            await cb.message.edit_text(
+            await send(chat_id, partial(
+                cb.message.edit_text,
                 caption + "\n\n(Схема недоступна, покажем текстовку)\n\nВыберите действие:",
                 reply_markup=preview_kb(spread_id)
-            )
+            ))
     else:
-        await cb.message.edit_text(
+        await send(chat_id, partial(
+            cb.message.edit_text,
             caption + "\n\n(Схема будет добавлена позже)\n\nВыберите действие:",
             reply_markup=preview_kb(spread_id)
-        )
+        ))
 
     await cb.answer()
 
@@ -123,15 +178,16 @@ async def on_spread(cb: types.CallbackQuery, state: FSMContext):
 async def back_to_spreads(cb: types.CallbackQuery, state: FSMContext):
     """Удаляет и превью, и старое сообщение с выбором расклада."""
     await state.set_state(Form.chosen_spread)
+    chat_id = cb.message.chat.id
     try:
         # Удаляем текущее сообщение (превью)
-        await cb.message.delete()
+        await send(chat_id, cb.message.delete)
         # Пытаемся удалить предыдущее сообщение (если есть)
-        await cb.message.chat.delete_message(cb.message.message_id - 1)
+        await send(chat_id, partial(cb.message.chat.delete_message, cb.message.message_id - 1))
     except Exception:
         pass
     # Отправляем новое одно сообщение "Выберите расклад"
-    await cb.message.answer("Выберите расклад:", reply_markup=SPREADS_KB)
+    await send(chat_id, partial(cb.message.answer, "Выберите расклад:", reply_markup=SPREADS_KB))
     await cb.answer()
 
 
@@ -141,91 +197,222 @@ async def on_shuffle(cb: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     spread_id = data.get("spread_id")
     question = data.get("question", "")
+    chat_id = cb.message.chat.id
     if not spread_id:
-        await cb.message.answer("Сначала выберите расклад.")
+        await send(chat_id, partial(cb.message.answer, "Сначала выберите расклад."))
         await cb.answer()
         return
 
     spread = SPREAD_BY_ID[spread_id]
+    started = time.perf_counter()
+    outcome = "error"
+    # Задачи ниже наследуют трассу через contextvars: их этапы попадут в неё же
+    trace = start_trace("reading", chat_id=chat_id, spread=spread.id)
 
-    await cb.message.answer("Колода перетасовывается… 🔁")
+    await send(chat_id, partial(cb.message.answer, "Колода перетасовывается… 🔁"))
 
     k = len(spread.positions)
-    drawn = draw_cards(k, reversed_enabled=True)
+    with span("draw", cards=k):
+        drawn = draw_cards(k, reversed_enabled=True)
 
-    pairs: list[dict] = []
-
-    for pos_name, (card, is_rev) in zip(spread.positions, drawn):
-        shown_name = card.name + (" (перевёрнутая)" if is_rev else "")
+    # Подсказки позиций (hints)
+    if getattr(spread, "hints", None) and len(spread.hints) == len(spread.positions):
+        hints = spread.hints
+    else:
+        hints = [""] * len(spread.positions)
 
-        # Для ИИ
-        pairs.append({
+    # Для ИИ
+    pairs: list[dict] = [
+        {
             "position": pos_name,
             "name": card.name,
             "reversed": is_rev,
             "theses": getattr(card, "meanings", {"upright": "", "reversed": ""}),
-        })
+        }
+        for pos_name, (card, is_rev) in zip(spread.positions, drawn)
+    ]
 
-        caption = f"Карта открывается… ✨\n<b>{md_escape(pos_name)}</b> — {md_escape(shown_name)}"
+    # Предыдущий незаконченный расклад в этом чате больше не нужен
+    READINGS.cancel(chat_id)
+    profiled = PROFILER.reading_started()
 
-        # Скругляем углы и отправляем как фото
-        photo_path = None
-        if card.image_path and os.path.exists(card.image_path):
-            photo_path = rounded_image_path(card.image_path, radius=48) or card.image_path
+    # Интерпретацию запускаем сразу: модель думает, пока открываются карты.
+    # Плейсхолдер появится после открытия карт — до этого запоминаем последний прогресс.
+    live: LiveMessage | None = None
+    latest: list = []  # [функция, возвращающая последний частичный ответ] — разбирается лениво
 
-        if photo_path and os.path.exists(photo_path):
-            try:
-                await cb.message.answer_photo(FSInputFile(photo_path), caption=caption)
-            except Exception:
-                await cb.message.answer(caption)
-        else:
-            await cb.message.answer(caption)
+    queue: dict = {}
 
-        await asyncio.sleep(0.15)
+    async def on_progress(get_partial):
+        latest[:] = [get_partial]
+        if live is not None:
+            # текст соберётся, только если LiveMessage действительно будет править сообщение
+            await live.update(lambda: format_reading(spread, get_partial(), final=False))
 
-    # Подсказки позиций (hints)
-    if getattr(spread, "hints", None) and len(spread.hints) == len(spread.positions):
-        hints = spread.hints
-    else:
-        hints = [""] * len(spread.positions)
+    async def on_queued(position: int):
+        queue["position"] = position
+        if live is not None and not latest:
+            await live.update(_queued_text(position))
 
-    # Интерпретация
-    interp = await build_interpretation(
+    interp_task = READINGS.track(chat_id, asyncio.create_task(build_interpretation(
         question=question,
         spread_title=spread.title,
         pairs=pairs,
-        position_hints=hints
-    )
+        position_hints=hints,
+        spread_id=spread.id,
+        on_progress=on_progress,
+        on_queued=on_queued,
+    )))
+    reveal_task = READINGS.track(chat_id, asyncio.create_task(_reveal(cb.message, spread, drawn)))
+
+    try:
+        await reveal_task
+
+        # Интерпретация: плейсхолдер дописывается по мере генерации
+        with span("live.create"):
+            live = await LiveMessage.create(
+                cb.message,
+                _queued_text(queue["position"]) if queue and not latest else "Толкую карты… ✍️",
+            )
+            if latest:
+                await live.update(format_reading(spread, latest[0](), final=False))
+
+        try:
+            with span("interp.wait"):
+                interp = await interp_task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Interpretation failed for spread %s", spread.id)
+            interp = {"cards": [], "summary": f"Не удалось получить ответ от модели: {e}"}
+
+        with span("live.finish"):
+            await live.finish(format_reading(spread, interp), reply_markup=final_kb())
+        if interp.get("summary") == DEGRADED_SUMMARY:
+            outcome = "degraded"
+        elif not interp.get("cards"):
+            outcome = "llm_error"
+        else:
+            outcome = "ok"
+        READING_SECONDS.observe(time.perf_counter() - started, spread=spread.id)
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        interp_task.cancel()
+        reveal_task.cancel()
+        # Отменили сам расклад («Новый расклад») — тихо выходим; отменили хендлер — пробрасываем
+        if asyncio.current_task().cancelling():
+            raise
+        return
+    finally:
+        READINGS_TOTAL.inc(spread=spread.id, outcome=outcome)
+        trace.finish(outcome=outcome)
+        if profiled:
+            PROFILER.reading_finished()
+        # Если расклад оборвался ошибкой — не оставляем запрос к модели висеть
+        if not interp_task.done():
+            interp_task.cancel()
+    await cb.answer()
+
+
+async def _reveal(message: types.Message, spread, drawn: list):
+    """Рендерит вытянутые карты и открывает их (альбомом, по одной или одной картинкой, см. Spread.reveal)."""
+    # Рендерим все карты параллельно, не блокируя других пользователей
+    async def render(card, is_rev: bool):
+        with span("render", card=card.id, rotated=is_rev):
+            return await rounded_image_path_async(card.image_path, radius=48, rotated=is_rev)
+
+    with span("reveal.render", cards=len(drawn)):
+        photo_paths = await asyncio.gather(*(render(card, is_rev) for card, is_rev in drawn))
 
+    items: list[RevealItem] = []
+    for pos_name, (card, is_rev), photo_path in zip(spread.positions, drawn, photo_paths):
+        shown_name = card.name + (" (перевёрнутая)" if is_rev else "")
+
+        # Если скруглить не удалось — отправляем исходник
+        if not photo_path and card.image_path:
+            photo_path = card.image_path
+
+        items.append(RevealItem(
+            caption=f"Карта открывается… ✨\n<b>{md_escape(pos_name)}</b> — {md_escape(shown_name)}",
+            album_caption=f"<b>{len(items) + 1}. {md_escape(pos_name)}</b> — {md_escape(shown_name)}",
+            photo_path=photo_path,
+        ))
+
+    with span("reveal.send", mode=spread.reveal):
+        await reveal_cards(message, items, mode=spread.reveal, layout=spread.layout)
+
+
+def _queued_text(position: int) -> str:
+    return f"Толкую карты… ✍️\nСейчас много раскладов — вы {position}-й в очереди ⏳"
+
+
+def format_reading(spread, interp: dict, final: bool = True) -> str:
+    """Текст ответа: карты с толкованиями и итог (частичный — пока идёт генерация)."""
     cards_md = render_cards_md(interp.get("cards", []))
     summary = md_escape(interp.get("summary", ""))
 
     # Итог показываем везде, кроме "Путь (3 карты)" — id="path"
     show_summary = (spread.id != "path")
 
-    final_text = f"<b>Ответ на ваш вопрос</b>\n\n{cards_md}"
+    text = f"<b>Ответ на ваш вопрос</b>\n\n{cards_md}"
+    if not final:
+        if show_summary and summary:
+            text += f"\n\n<b>Итог:</b> {summary}"
+        return text + " ✍️"
     if show_summary:
-        final_text += f"\n\n<b>Итог:</b> {summary}\n\n🌙 Благодарим за доверие. Белая Лисица рядом."
-
-    await cb.message.answer(final_text, reply_markup=final_kb())
-    await cb.answer()
+        text += f"\n\n<b>Итог:</b> {summary}\n\n🌙 Благодарим за доверие. Белая Лисица рядом."
+    return text
 
 
 # Финальные кнопки
 @dp.callback_query(F.data == "new")
 async def on_new(cb: types.CallbackQuery, state: FSMContext):
+    # Обрываем незаконченный расклад: не досылаем карты и не ждём модель
+    READINGS.cancel(cb.message.chat.id)
     await state.clear()
     await cb.message.answer("Начнём заново. Выберите действие:", reply_markup=MAIN_MENU)
     await cb.answer()
 
 
 # ---- Точка входа ----
-async def main():
+async def main(startup_report: str | None = None, startup_only: bool = False):
+    # INFO: трассы раскладов (app/tracing.py) и usage модели пишутся в лог на этом уровне
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
     if not TOKEN:
         raise RuntimeError("Нет TG_BOT_TOKEN в .env")
-    bot = Bot(TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-    await dp.start_polling(bot)
+    bot = make_bot()
+    if startup_report:
+        from .startup import first_poll_middleware
+        bot.session.middleware(first_poll_middleware(startup_report, exit_after=startup_only))
+    STARTUP.mark("bot session")
+    # Недостающие картинки видны сразу в логе, а не при первом раскладе
+    report_missing_assets()
+    STARTUP.mark("media check")
+    metrics_runner = await start_metrics_server()
+    arm_from_env()
+    # Просим у Telegram только те типы апдейтов, на которые есть хендлеры
+    allowed_updates = dp.resolve_used_update_types()
+    try:
+        if os.getenv("BOT_MODE", "").strip().lower() == "webhook":
+            from .webhook import run_webhook
+            await run_webhook(bot, dp, allowed_updates)
+        else:
+            # Если раньше работали через вебхук, getUpdates упадёт с конфликтом, пока он не снят
+            await bot.delete_webhook(drop_pending_updates=False)
+            await dp.start_polling(bot, allowed_updates=allowed_updates)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await close_http_client()
+        shutdown_executor()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(prog="python -m app.bot")
+    parser.add_argument(
+        "--startup-report", nargs="?", const="text", choices=("text", "json"),
+        help="напечатать в stderr время запуска по фазам (при первом getUpdates)",
+    )
+    parser.add_argument("--startup-only", action="store_true", help="после отчёта выйти, не опрашивая Telegram")
+    args = parser.parse_args()
+    asyncio.run(main(args.startup_report or ("text" if args.startup_only else None), args.startup_only))
@@ -0,0 +1,115 @@
+"""
+Заполняет хранилище значений карт по позициям (см. app/meanings_store.py).
+
+Запуск:
+    python -m app.build_meanings [--spreads path,celtic] [--concurrency 4] [--db PATH]
+
+Для каждой карты в каждом положении и каждого расклада делает один запрос
+к модели и получает значения сразу для всех позиций расклада. Уже заполненные
+сочетания пропускаются, поэтому сборку можно прерывать и продолжать.
+Запросы идут через тот же chat/completions, что и у бота: OPENAI_BASE_URL
+позволяет подставить локальный сервер-заглушку.
+"""
+import os
+import json
+import asyncio
+import argparse
+
+from dotenv import load_dotenv
+
+from .deck import DECK
+from .spreads import SPREADS, Spread
+from .meanings_store import DEFAULT_DB, MeaningStore
+from .llm import chat_completion, close_http_client, init_http_client, _strip_code_fences
+
+BUILDER_PROMPT = (
+    "Ты — профессиональный таролог студии White Fox. Пишешь справочные значения карт Таро "
+    "для конкретных позиций расклада — без привязки к вопросу пользователя.\n\n"
+    "Стиль: умный, спокойный, честный, без мистики и эзотерических клише.\n\n"
+    "Формат ответа — только JSON: { \"meanings\": [\"...\", ...] } — "
+    "по одному значению (3–4 предложения) на каждую позицию, в том же порядке."
+)
+
+
+async def _build_one(store: MeaningStore, spread: Spread, card, reversed_: bool, model: str) -> bool:
+    hints = spread.hints if spread.hints and len(spread.hints) == len(spread.positions) else [""] * len(spread.positions)
+    payload = {
+        "spread_title": spread.title,
+        "card": card.name,
+        "reversed": reversed_,
+        "theses": card.meanings.get("reversed" if reversed_ else "upright", ""),
+        "positions": [{"position": p, "hint": h} for p, h in zip(spread.positions, hints)],
+    }
+    text = await chat_completion(
+        [
+            {"role": "system", "content": BUILDER_PROMPT},
+            {"role": "user", "content": f"Данные: {json.dumps(payload, ensure_ascii=False)}"},
+        ],
+        max_tokens=120 * len(spread.positions),
+    )
+    meanings = json.loads(_strip_code_fences(text)).get("meanings")
+    if not isinstance(meanings, list) or len(meanings) != len(spread.positions) or not all(meanings):
+        return False
+    store.put_many(spread.id, card.name, reversed_, [str(m).strip() for m in meanings], model=model)
+    return True
+
+
+async def build(store: MeaningStore, spreads: list[Spread], concurrency: int = 4) -> dict:
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip()
+    jobs = [
+        (spread, card, reversed_)
+        for spread in spreads
+        for card in DECK
+        for reversed_ in (False, True)
+        if not store.has_all(spread.id, len(spread.positions), card.name, reversed_)
+    ]
+    sem = asyncio.Semaphore(max(1, concurrency))
+    report = {"todo": len(jobs), "ok": 0, "failed": 0}
+
+    async def worker(spread: Spread, card, reversed_: bool):
+        async with sem:
+            try:
+                ok = await _build_one(store, spread, card, reversed_, model)
+            except Exception as e:
+                print(f"✗ {spread.id} / {card.name}{' (перев.)' if reversed_ else ''}: {e}")
+                ok = False
+        report["ok" if ok else "failed"] += 1
+        done = report["ok"] + report["failed"]
+        if done % 50 == 0 or done == report["todo"]:
+            print(f"… {done}/{report['todo']}")
+
+    await asyncio.gather(*(worker(*job) for job in jobs))
+    return report
+
+
+async def _main(args) -> int:
+    spreads = SPREADS
+    if args.spreads:
+        wanted = {s.strip() for s in args.spreads.split(",") if s.strip()}
+        spreads = [s for s in SPREADS if s.id in wanted]
+
+    store = MeaningStore(args.db, create=True)
+    init_http_client()
+    try:
+        report = await build(store, spreads, concurrency=args.concurrency)
+    finally:
+        await close_http_client()
+
+    print(
+        f"Готово: заполнено {report['ok']}, ошибок {report['failed']}, "
+        f"всего значений в хранилище {store.count()} ({args.db})"
+    )
+    return 1 if report["failed"] else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m app.build_meanings", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--spreads", default="", help="id раскладов через запятую (по умолчанию — все)")
+    parser.add_argument("--concurrency", type=int, default=4, help="одновременных запросов к модели")
+    parser.add_argument("--db", default=os.getenv("MEANINGS_DB", "").strip() or DEFAULT_DB, help="путь к SQLite")
+    return asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
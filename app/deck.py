@@ -1,9 +1,11 @@
-import os, random
+import random
+from array import array
 from dataclasses import dataclass
 from .cards_data import CARD_NAMES
 from .cards_meanings import CARDS_MEANINGS
+from .media_manifest import get_media
 
-@dataclass
+@dataclass(slots=True)
 class Card:
     id: int
     name: str
@@ -11,24 +13,42 @@ class Card:
     meanings: dict   # {"upright": "...", "reversed": "..."}
 
 def _guess_image_path(card_id: int) -> str:
-    bases = [f"{card_id}", f"{card_id:02d}", f"{card_id:03d}"]
-    exts = ["png", "jpg", "jpeg"]
-    for base in bases:
-        for ext in exts:
-            p = os.path.join("media", "cards", f"{base}.{ext}")
-            if os.path.exists(p):
-                return p
-    return ""
+    # media/cards/{1,01,001}.{png,jpg,jpeg} — поиск по манифесту, без обращений к диску
+    return get_media().find("cards", f"{card_id}", f"{card_id:02d}", f"{card_id:03d}")
 
 DECK = []
 for i, name in enumerate(CARD_NAMES, 1):
     meanings = CARDS_MEANINGS.get(name, {"upright": "", "reversed": ""})
     DECK.append(Card(i, name, _guess_image_path(i), meanings))
 
+# id карты = индекс в DECK + 1
+DECK_SIZE = len(DECK)
+
+
+def card_by_id(card_id: int) -> Card:
+    return DECK[card_id - 1]
+
+
+@dataclass(slots=True)
+class Draw:
+    """Компактный расклад: id карт по позициям и биты «перевёрнута» (0/1) в array."""
+    ids: array       # array("H")
+    reversed: array  # array("B")
+
+    def cards(self) -> list[tuple[Card, bool]]:
+        return [(DECK[i - 1], bool(r)) for i, r in zip(self.ids, self.reversed)]
+
+
+def draw_ids(k: int, reversed_enabled: bool = True, rng: random.Random | None = None) -> Draw:
+    rng = rng or random
+    ids = array("H", rng.sample(range(1, DECK_SIZE + 1), k))
+    if reversed_enabled:
+        bits = rng.getrandbits(k) if k else 0
+        rev = array("B", ((bits >> j) & 1 for j in range(k)))
+    else:
+        rev = array("B", bytes(k))
+    return Draw(ids, rev)
+
+
 def draw_cards(k: int, reversed_enabled: bool = True):
-    chosen = random.sample(DECK, k)
-    result = []
-    for c in chosen:
-        is_rev = reversed_enabled and (random.random() < 0.5)
-        result.append((c, is_rev))
-    return result
+    return draw_ids(k, reversed_enabled).cards()
@@ -0,0 +1,189 @@
+"""
+Пакетная генерация раскладов для нагрузочных тестов и проверки честности колоды.
+
+Запуск:
+    python -m app.deck_sim [--readings 1000000] [--seed 1] [--sizes 1,3,10] [--json]
+
+Для каждого размера расклада (по умолчанию — все размеры из SPREADS) тянет заданное
+число раскладов и печатает частоты карт и переворотов: отклонение от ожидаемого,
+хи-квадрат по картам и долю перевёрнутых карт.
+
+Быстрый путь использует NumPy (pip install numpy) и генератор numpy.random.Generator
+с заданным seed: миллион раскладов считается за секунды. Без NumPy отчёт считается
+тем же алгоритмом, что и у бота (deck.draw_ids), — честно, но заметно медленнее.
+"""
+import math
+import json
+import time
+import random
+import argparse
+from typing import Iterator
+
+from .deck import DECK, DECK_SIZE, draw_ids
+from .spreads import SPREADS
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не обязателен для бота
+    np = None
+
+# Сколько раскладов генерировать за один шаг: n × 78 float32 ≈ 31 МБ на 100 000
+DEFAULT_CHUNK = 100_000
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Для пакетной генерации нужен NumPy: pip install numpy")
+
+
+def draw_batch(n: int, k: int, reversed_enabled: bool = True, rng=None, seed: int | None = None):
+    """
+    n раскладов по k карт за один вызов.
+    Возвращает (ids, reversed): массивы формы (n, k) — uint8 с id карт (1..78) и bool.
+    Карты внутри расклада не повторяются, порядок случайный, как у draw_cards.
+    """
+    _require_numpy()
+    if not 0 <= k <= DECK_SIZE:
+        raise ValueError(f"k должно быть от 0 до {DECK_SIZE}, а не {k}")
+    rng = rng if rng is not None else np.random.default_rng(seed)
+    if k == 0:
+        return np.zeros((n, 0), dtype=np.uint8), np.zeros((n, 0), dtype=bool)
+
+    # k наименьших из независимых равномерных ключей — случайное подмножество без повторов,
+    # а сортировка по ключу даёт случайный порядок внутри него
+    keys = rng.random((n, DECK_SIZE), dtype=np.float32)
+    idx = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(keys, idx, axis=1), axis=1)
+    ids = (np.take_along_axis(idx, order, axis=1) + 1).astype(np.uint8)
+
+    if reversed_enabled:
+        rev = rng.random((n, k), dtype=np.float32) < 0.5
+    else:
+        rev = np.zeros((n, k), dtype=bool)
+    return ids, rev
+
+
+def iter_batches(
+    n: int,
+    k: int,
+    reversed_enabled: bool = True,
+    seed: int | None = None,
+    chunk: int = DEFAULT_CHUNK,
+) -> Iterator[tuple]:
+    """draw_batch по частям, чтобы миллионы раскладов не держать в памяти целиком."""
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    done = 0
+    while done < n:
+        size = min(chunk, n - done)
+        yield draw_batch(size, k, reversed_enabled, rng=rng)
+        done += size
+
+
+def _counts_numpy(n: int, k: int, seed: int | None) -> tuple[list[int], list[int]]:
+    cards = np.zeros(DECK_SIZE + 1, dtype=np.int64)
+    reversed_ = np.zeros(DECK_SIZE + 1, dtype=np.int64)
+    for ids, rev in iter_batches(n, k, seed=seed):
+        flat = ids.ravel()
+        cards += np.bincount(flat, minlength=DECK_SIZE + 1)
+        reversed_ += np.bincount(flat[rev.ravel()], minlength=DECK_SIZE + 1)
+    return cards[1:].tolist(), reversed_[1:].tolist()
+
+
+def _counts_python(n: int, k: int, seed: int | None) -> tuple[list[int], list[int]]:
+    rng = random.Random(seed)
+    cards = [0] * DECK_SIZE
+    reversed_ = [0] * DECK_SIZE
+    for _ in range(n):
+        draw = draw_ids(k, rng=rng)
+        for card_id, r in zip(draw.ids, draw.reversed):
+            cards[card_id - 1] += 1
+            reversed_[card_id - 1] += r
+    return cards, reversed_
+
+
+def _chi2_pvalue(chi2: float, dof: int) -> float:
+    """Правый хвост хи-квадрат (приближение Уилсона–Хилферти; для dof ≈ 77 точности хватает)."""
+    if dof <= 0:
+        return 1.0
+    z = ((chi2 / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def frequency_stats(n: int, k: int, seed: int | None = None, backend: str | None = None) -> dict:
+    """Частоты карт и переворотов для n раскладов по k карт."""
+    backend = backend or ("numpy" if np is not None else "python")
+    started = time.perf_counter()
+    if backend == "numpy":
+        cards, reversed_ = _counts_numpy(n, k, seed)
+    else:
+        cards, reversed_ = _counts_python(n, k, seed)
+    elapsed = time.perf_counter() - started
+
+    expected = n * k / DECK_SIZE
+    chi2 = sum((c - expected) ** 2 / expected for c in cards) if expected else 0.0
+    total = sum(cards)
+    rev_total = sum(reversed_)
+    deviations = [(c - expected) / expected for c in cards] if expected else [0.0] * DECK_SIZE
+    rev_rates = [r / c if c else 0.0 for c, r in zip(cards, reversed_)]
+    lo = min(range(DECK_SIZE), key=deviations.__getitem__)
+    hi = max(range(DECK_SIZE), key=deviations.__getitem__)
+    return {
+        "spread_size": k,
+        "readings": n,
+        "backend": backend,
+        "seconds": round(elapsed, 3),
+        "expected_per_card": round(expected, 2),
+        "chi2": round(chi2, 2),
+        "dof": DECK_SIZE - 1,
+        "p_value": round(_chi2_pvalue(chi2, DECK_SIZE - 1), 4),
+        "least_drawn": {"card": DECK[lo].name, "count": cards[lo], "deviation": round(deviations[lo], 4)},
+        "most_drawn": {"card": DECK[hi].name, "count": cards[hi], "deviation": round(deviations[hi], 4)},
+        "reversed_rate": round(rev_total / total, 4) if total else 0.0,
+        "reversed_rate_min": round(min(rev_rates), 4),
+        "reversed_rate_max": round(max(rev_rates), 4),
+        "cards": {c.name: {"count": cards[i], "reversed": reversed_[i]} for i, c in enumerate(DECK)},
+    }
+
+
+def _print_report(report: dict):
+    r = report
+    print(
+        f"k={r['spread_size']:>2}  раскладов {r['readings']:,} ({r['backend']}, {r['seconds']} с)\n"
+        f"    ожидаемо на карту {r['expected_per_card']:,}; "
+        f"χ²={r['chi2']} при {r['dof']} ст. св., p={r['p_value']}\n"
+        f"    реже всех: {r['least_drawn']['card']} ({r['least_drawn']['deviation']:+.2%}), "
+        f"чаще всех: {r['most_drawn']['card']} ({r['most_drawn']['deviation']:+.2%})\n"
+        f"    перевёрнутых {r['reversed_rate']:.2%} (по картам от {r['reversed_rate_min']:.2%} "
+        f"до {r['reversed_rate_max']:.2%})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Статистика честности колоды по размерам раскладов")
+    parser.add_argument("--readings", type=int, default=1_000_000, help="раскладов на каждый размер")
+    parser.add_argument("--seed", type=int, default=None, help="seed генератора для воспроизводимости")
+    parser.add_argument("--sizes", default="", help="размеры раскладов через запятую (по умолчанию — из SPREADS)")
+    parser.add_argument("--backend", choices=("numpy", "python"), default=None)
+    parser.add_argument("--json", action="store_true", help="вывести полный отчёт в JSON")
+    args = parser.parse_args()
+
+    if args.backend == "numpy":
+        _require_numpy()
+    if args.sizes:
+        sizes = sorted({int(s) for s in args.sizes.split(",") if s.strip()})
+    else:
+        sizes = sorted({len(s.positions) for s in SPREADS})
+    if np is None and args.backend is None:
+        print("NumPy не установлен — считаем без него, это медленнее (pip install numpy)")
+
+    reports = [frequency_stats(args.readings, k, args.seed, args.backend) for k in sizes]
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+        return
+    for report in reports:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Профили кодирования готовых картинок карт (кэш рендера, см. app/render_cache.py).
+
+Telegram всё равно пережимает фото до ~1280 px по большей стороне, поэтому отдавать
+ему PNG в полном разрешении — лишние мегабайты загрузки и диска. Профиль задаёт
+формат, предельный размер, качество и субдискретизацию цвета; картинка с прозрачностью
+в формате без альфа-канала (JPEG) сохраняется в PNG.
+
+    python -m app.encoding                       # отчёт по всем профилям на всей колоде
+    python -m app.encoding --profiles telegram,lite --limit 10
+    python -m app.encoding --json
+
+Отчёт: средний/суммарный размер файла, время кодирования и PSNR относительно
+PNG без потерь, уменьшенного до того же размера (то, что увидит пользователь).
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+from dataclasses import dataclass, asdict
+
+logger = logging.getLogger(__name__)
+
+# ===== Выбор профиля =====
+# RENDER_PROFILE = lossless | telegram | hq | lite | webp (по умолчанию telegram)
+# Профиль входит в ключ кэша рендера, так что смена профиля не подхватит старые картинки.
+# ==========================
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    name: str
+    format: str                   # "JPEG" | "WEBP" | "PNG"
+    max_edge: int | None = None   # None — без уменьшения
+    quality: int = 85
+    subsampling: str = "4:2:0"    # только для JPEG
+    alpha_fallback: str = "PNG"   # куда сохранять картинку с прозрачностью, если формат её не держит
+
+    @property
+    def extension(self) -> str:
+        return {"JPEG": ".jpg", "WEBP": ".webp", "PNG": ".png"}[self.format]
+
+    def for_alpha(self, alpha: bool) -> "EncodingProfile":
+        """Профиль, которым реально сохраним картинку (с учётом альфа-канала)."""
+        if alpha and self.format == "JPEG":
+            return EncodingProfile(self.name, self.alpha_fallback, self.max_edge)
+        return self
+
+
+PROFILES: dict[str, EncodingProfile] = {
+    p.name: p for p in (
+        EncodingProfile("lossless", "PNG"),                                   # как раньше: PNG в полном размере
+        EncodingProfile("telegram", "JPEG", 1280, quality=85),                # под пережатие Telegram
+        EncodingProfile("hq", "JPEG", 1600, quality=92, subsampling="4:4:4"),  # мелкий текст на картах без «мыла»
+        EncodingProfile("lite", "JPEG", 960, quality=75),                     # слабый канал
+        EncodingProfile("webp", "WEBP", 1280, quality=80),
+    )
+}
+DEFAULT_PROFILE = "telegram"
+
+_warned: set[str] = set()
+
+
+def get_profile(name: str | None = None) -> EncodingProfile:
+    name = (name or os.getenv("RENDER_PROFILE", "").strip() or DEFAULT_PROFILE).lower()
+    profile = PROFILES.get(name)
+    if profile is None:
+        if name not in _warned:
+            _warned.add(name)
+            logger.warning("Unknown RENDER_PROFILE %r, using %s", name, DEFAULT_PROFILE)
+        profile = PROFILES[DEFAULT_PROFILE]
+    return profile
+
+
+def has_alpha(img) -> bool:
+    """Есть ли в картинке хоть один не полностью непрозрачный пиксель."""
+    if img.mode == "P" and "transparency" in img.info:
+        img = img.convert("RGBA")
+    if img.mode not in ("RGBA", "LA", "PA"):
+        return False
+    return img.getchannel("A").getextrema()[0] < 255
+
+
+def fit(img, profile: EncodingProfile):
+    """Уменьшает картинку до max_edge по большей стороне (не увеличивает)."""
+    if not profile.max_edge or max(img.size) <= profile.max_edge:
+        return img
+    from PIL import Image
+
+    k = profile.max_edge / max(img.size)
+    size = (max(1, round(img.width * k)), max(1, round(img.height * k)))
+    return img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def encode(img, profile: EncodingProfile) -> bytes:
+    """Кодирует картинку по профилю (вместе с уменьшением)."""
+    img = fit(img, profile)
+    profile = profile.for_alpha(has_alpha(img))
+    out = io.BytesIO()
+    if profile.format == "PNG":
+        img.save(out, "PNG", optimize=True)
+    elif profile.format == "JPEG":
+        img.convert("RGB").save(
+            out, "JPEG", quality=profile.quality, subsampling=profile.subsampling,
+            optimize=True, progressive=True,
+        )
+    else:
+        img.save(out, profile.format, quality=profile.quality, method=4)
+    return out.getvalue()
+
+
+# ---- Отчёт по колоде ----
+def _psnr(a, b) -> float | None:
+    """PSNR в дБ; None — картинки совпадают (или разного размера)."""
+    from PIL import ImageChops, ImageStat
+
+    if a.size != b.size:
+        return None
+    diff = ImageChops.difference(a.convert("RGB"), b.convert("RGB"))
+    mse = sum(v * v for v in ImageStat.Stat(diff).rms) / 3
+    if mse == 0:
+        return None
+    return round(10 * math.log10(255 ** 2 / mse), 2)
+
+
+def report(profiles: list[EncodingProfile], limit: int | None = None, radius: int | None = None) -> dict:
+    """Рендерит карты колоды в памяти и кодирует каждым профилем."""
+    from PIL import Image
+
+    from .deck import DECK
+    from .utils import compose_card
+
+    cards = [c for c in DECK if c.image_path][:limit]
+    rows = {p.name: {"bytes": 0, "seconds": 0.0, "psnr": [], "size": None} for p in profiles}
+    for card in cards:
+        img = compose_card(card.image_path, radius)
+        if img is None:
+            continue
+        for p in profiles:
+            t0 = time.perf_counter()
+            data = encode(img, p)
+            row = rows[p.name]
+            row["seconds"] += time.perf_counter() - t0
+            row["bytes"] += len(data)
+            with Image.open(io.BytesIO(data)) as decoded:
+                row["size"] = decoded.size
+                reference = fit(img, p)
+                psnr = _psnr(reference, decoded)
+            if psnr is not None:
+                row["psnr"].append(psnr)
+
+    n = len(cards) or 1
+    return {
+        "cards": len(cards),
+        "profiles": [
+            {
+                **asdict(p),
+                "output_size": row["size"],
+                "avg_kb": round(row["bytes"] / n / 1024, 1),
+                "total_mb": round(row["bytes"] / 1024 / 1024, 2),
+                "avg_encode_ms": round(row["seconds"] / n * 1000, 1),
+                "min_psnr_db": min(row["psnr"]) if row["psnr"] else None,
+                "avg_psnr_db": round(sum(row["psnr"]) / len(row["psnr"]), 2) if row["psnr"] else None,
+            }
+            for p, row in ((p, rows[p.name]) for p in profiles)
+        ],
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m app.encoding", description="Отчёт по профилям кодирования карт")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="через запятую (по умолчанию все)")
+    parser.add_argument("--limit", type=int, default=None, help="только первые N карт колоды")
+    parser.add_argument("--radius", type=int, default=None, help="радиус скругления (по умолчанию CARD_RADIUS)")
+    parser.add_argument("--json", action="store_true", help="вывести отчёт одной строкой JSON")
+    args = parser.parse_args(argv)
+
+    unknown = [n for n in args.profiles.split(",") if n.strip() not in PROFILES]
+    if unknown:
+        parser.error(f"неизвестные профили: {', '.join(unknown)}")
+    profiles = [PROFILES[n.strip()] for n in args.profiles.split(",")]
+
+    data = report(profiles, args.limit, args.radius)
+    if args.json:
+        print(json.dumps(data, ensure_ascii=False))
+        return 0
+
+    current = get_profile().name
+    print(f"Карт: {data['cards']}; текущий профиль: {current}\n")
+    print(f"  {'профиль':<10} {'формат':<6} {'размер':>10} {'средний':>10} {'всего':>9} {'кодир.':>9} {'PSNR мин/ср':>14}")
+    for p in data["profiles"]:
+        size = "x".join(map(str, p["output_size"])) if p["output_size"] else "—"
+        psnr = "без потерь" if p["avg_psnr_db"] is None else f"{p['min_psnr_db']}/{p['avg_psnr_db']}"
+        print(
+            f"{'*' if p['name'] == current else ' '} {p['name']:<10} {p['format']:<6} {size:>10} "
+            f"{p['avg_kb']:>7.1f} KB {p['total_mb']:>6.2f} MB {p['avg_encode_ms']:>6.1f} ms {psnr:>14}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import os
+import json
+import asyncio
+import sqlite3
+import threading
+from typing import Protocol
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from .metrics import UPLOAD_SECONDS
+from .render_cache import _file_hash
+
+# ===== Реестр file_id для отправленных картинок =====
+# Telegram возвращает file_id для каждой загруженной фотографии; повторная
+# отправка по file_id не требует повторной загрузки файла.
+#
+# FILE_ID_STORE = где хранить реестр:
+#   sqlite:media/cache/file_ids.sqlite3   (по умолчанию, можно шарить между репликами)
+#   json:media/cache/file_ids.json
+#   memory:                               (без сохранения между перезапусками)
+# ====================================================
+
+DEFAULT_STORE = "sqlite:" + os.path.join("media", "cache", "file_ids.sqlite3")
+
+
+class FileIdBackend(Protocol):
+    def get(self, key: str) -> str | None: ...
+    def set(self, key: str, file_id: str) -> None: ...
+    def delete(self, key: str) -> None: ...
+
+
+class MemoryBackend:
+    """Хранит file_id только в памяти процесса."""
+
+    def __init__(self):
+        self._data: dict[str, str] = {}
+
+    def get(self, key: str) -> str | None:
+        return self._data.get(key)
+
+    def set(self, key: str, file_id: str) -> None:
+        self._data[key] = file_id
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class JsonFileBackend:
+    """JSON-файл на диске. Перед записью перечитывает файл, пишет атомарно."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self) -> dict[str, str]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _dump(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def get(self, key: str) -> str | None:
+        return self._data.get(key)
+
+    def set(self, key: str, file_id: str) -> None:
+        with self._lock:
+            # подхватываем записи, сделанные другими процессами
+            self._data = {**self._load(), **self._data, key: file_id}
+            self._dump()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data = self._load()
+            if self._data.pop(key, None) is not None:
+                self._dump()
+
+
+class SqliteBackend:
+    """SQLite-файл: безопасен для нескольких процессов/реплик на общем томе."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids (key TEXT PRIMARY KEY, file_id TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT file_id FROM file_ids WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, file_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_ids (key, file_id) VALUES (?, ?)", (key, file_id)
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+            self._conn.commit()
+
+
+def backend_from_spec(spec: str) -> FileIdBackend:
+    """Разбирает строку вида 'sqlite:path', 'json:path' или 'memory:'."""
+    kind, _, path = spec.partition(":")
+    kind = kind.strip().lower()
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "json":
+        return JsonFileBackend(path or os.path.join("media", "cache", "file_ids.json"))
+    if kind == "sqlite":
+        return SqliteBackend(path or os.path.join("media", "cache", "file_ids.sqlite3"))
+    raise ValueError(f"Неизвестный FILE_ID_STORE: {spec!r}")
+
+
+class FileIdRegistry:
+    """
+    Сопоставляет локальный файл картинки с file_id в Telegram.
+    Ключ: id бота (file_id привязан к боту) + путь + sha256 содержимого (из манифеста
+    медиа, если файл не менялся), чтобы перерисованная картинка с тем же именем —
+    даже того же размера — не отдавала старый file_id.
+
+    Бэкенд синхронный (SQLite может ждать блокировку до 5 с на общем томе), поэтому
+    методы реестра уходят в поток и не останавливают event loop.
+    """
+
+    def __init__(self, backend: FileIdBackend):
+        self.backend = backend
+
+    @staticmethod
+    def key(bot_id: int, path: str) -> str | None:
+        digest = _file_hash(path)
+        if not digest:
+            return None
+        return f"{bot_id}:{os.path.normpath(path)}:{digest}"
+
+    def _get(self, bot_id: int, path: str) -> str | None:
+        key = self.key(bot_id, path)
+        return self.backend.get(key) if key else None
+
+    def _remember(self, bot_id: int, path: str, file_id: str) -> None:
+        key = self.key(bot_id, path)
+        if key and file_id:
+            self.backend.set(key, file_id)
+
+    def _forget(self, bot_id: int, path: str) -> None:
+        key = self.key(bot_id, path)
+        if key:
+            self.backend.delete(key)
+
+    async def get(self, bot_id: int, path: str) -> str | None:
+        return await asyncio.to_thread(self._get, bot_id, path)
+
+    async def remember(self, bot_id: int, path: str, file_id: str) -> None:
+        await asyncio.to_thread(self._remember, bot_id, path, file_id)
+
+    async def forget(self, bot_id: int, path: str) -> None:
+        await asyncio.to_thread(self._forget, bot_id, path)
+
+
+_registry: FileIdRegistry | None = None
+
+
+def get_registry() -> FileIdRegistry:
+    """Общий реестр процесса; бэкенд выбирается через FILE_ID_STORE."""
+    global _registry
+    if _registry is None:
+        spec = os.getenv("FILE_ID_STORE", "").strip() or DEFAULT_STORE
+        _registry = FileIdRegistry(backend_from_spec(spec))
+    return _registry
+
+
+async def photo_input(bot_id: int, path: str) -> str | FSInputFile:
+    """Возвращает file_id, если картинка уже загружалась, иначе файл для загрузки."""
+    return await get_registry().get(bot_id, path) or FSInputFile(path)
+
+
+async def remember_sent(bot_id: int, path: str, sent: Message) -> None:
+    """Запоминает file_id самой большой версии фото из отправленного сообщения."""
+    if sent and sent.photo:
+        await get_registry().remember(bot_id, path, sent.photo[-1].file_id)
+
+
+async def answer_photo_cached(message: Message, path: str, **kwargs) -> Message:
+    """
+    answer_photo с переиспользованием file_id.
+    Если сохранённый file_id не принят Telegram — забываем его и грузим файл заново.
+    """
+    bot_id = message.bot.id
+    registry = get_registry()
+    file_id = await registry.get(bot_id, path)
+    if file_id:
+        try:
+            with UPLOAD_SECONDS.time(kind="file_id"):
+                return await message.answer_photo(file_id, **kwargs)
+        except TelegramBadRequest:
+            await registry.forget(bot_id, path)
+
+    with UPLOAD_SECONDS.time(kind="upload"):
+        sent = await message.answer_photo(FSInputFile(path), **kwargs)
+    await remember_sent(bot_id, path, sent)
+    return sent
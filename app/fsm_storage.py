@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+# ===== Хранилище состояний диалога (FSM) =====
+# FSM_STORAGE        = sqlite:media/cache/fsm.sqlite3 (по умолчанию) или memory:
+# FSM_FLUSH_INTERVAL = как часто сбрасывать накопленные изменения в SQLite, сек (по умолчанию 0.2)
+# FSM_HOT_TTL        = сколько секунд читать запись из памяти без похода в SQLite (по умолчанию 30;
+#                      в BOT_MODE=webhook без app.supervisor — 0, см. ниже)
+# FSM_HOT_SIZE       = сколько записей держать в памяти (по умолчанию 10000)
+#
+# Записи копятся в памяти и уходят в SQLite пачкой (write-behind), чтения обслуживает
+# горячий слой в памяти процесса. SQLite работает в режиме WAL с busy_timeout, поэтому
+# один файл могут делить несколько процессов на одной машине. Изменения, сделанные
+# другим процессом, видны после сброса у него и истечения FSM_HOT_TTL у нас;
+# при шардировании по chat_id каждый чат обслуживает один процесс, и расхождений нет.
+# Несколько экземпляров app.bot за балансировщиком (webhook) шардирования не дают:
+# апдейты одного чата попадают в разные процессы, и с FSM_HOT_TTL=30 один из них до 30 секунд
+# видел бы устаревшее состояние. Поэтому в webhook-режиме без супервизора горячий слой
+# по умолчанию не кэширует чтения (FSM_HOT_TTL=0); app.supervisor явно ставит 30.
+# ===============================================
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+class _Entry:
+    __slots__ = ("state", "data", "loaded_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], loaded_at: float):
+        self.state = state
+        self.data = data
+        self.loaded_at = loaded_at
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.2,
+        hot_ttl: float = 30,
+        hot_size: int = 10000,
+        key_builder: KeyBuilder | None = None,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.hot_ttl = hot_ttl
+        self.hot_size = hot_size
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+        self._hot: OrderedDict[str, _Entry] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flushing: set[str] = set()  # уходят в SQLite прямо сейчас
+        self._conn: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._flush_lock: asyncio.Lock | None = None
+
+    # ---- SQLite ----
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                " key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _read_row(self, key: str) -> tuple[Optional[str], Dict[str, Any]]:
+        with self._db_lock:
+            row = self._connect().execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    def _write_rows(self, rows: list[tuple[str, Optional[str], Dict[str, Any]]]):
+        now = time.time()
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                for key, state, data in rows:
+                    if state is None and not data:
+                        conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+                    else:
+                        conn.execute(
+                            "INSERT INTO fsm (key, state, data, updated) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT(key) DO UPDATE SET state = excluded.state, "
+                            "data = excluded.data, updated = excluded.updated",
+                            (key, state, json.dumps(data, ensure_ascii=False), now),
+                        )
+
+    # ---- горячий слой ----
+    async def _entry(self, key: StorageKey) -> tuple[str, _Entry]:
+        k = self.key_builder.build(key)
+        entry = self._hot.get(k)
+        now = time.monotonic()
+        if entry is not None and (self._pinned(k) or now - entry.loaded_at < self.hot_ttl):
+            self._hot.move_to_end(k)
+            return k, entry
+
+        state, data = await asyncio.to_thread(self._read_row, k)
+        # пока читали, запись могли изменить в этом же процессе — она свежее
+        entry = self._hot.get(k)
+        if entry is not None and self._pinned(k):
+            return k, entry
+        entry = _Entry(state, data, now)
+        self._hot[k] = entry
+        self._evict()
+        return k, entry
+
+    def _evict(self):
+        if len(self._hot) <= self.hot_size:
+            return
+        for k in list(self._hot):
+            if len(self._hot) <= self.hot_size:
+                break
+            if not self._pinned(k):
+                del self._hot[k]
+
+    def _pinned(self, k: str) -> bool:
+        """Несохранённую запись нельзя ни вытеснить, ни перечитать из SQLite."""
+        return k in self._dirty or k in self._flushing
+
+    def _mark_dirty(self, k: str):
+        self._dirty.add(k)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        try:
+            while self._dirty:
+                await asyncio.sleep(self.flush_interval)
+                try:
+                    await self.flush()
+                except Exception:
+                    # ошибка уже залогирована, изменения вернулись в очередь — попробуем снова
+                    pass
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self):
+        """Сбрасывает накопленные изменения в SQLite одной транзакцией."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            self._flushing = keys
+            rows = []
+            for k in keys:
+                entry = self._hot.get(k)
+                if entry is not None:
+                    rows.append((k, entry.state, dict(entry.data)))
+            try:
+                await asyncio.to_thread(self._write_rows, rows)
+            except Exception:
+                logger.exception("FSM flush failed, will retry")
+                self._dirty |= keys
+                raise
+            finally:
+                self._flushing = set()
+            now = time.monotonic()
+            for k in keys:
+                entry = self._hot.get(k)
+                if entry is not None:
+                    entry.loaded_at = now
+
+    # ---- BaseStorage ----
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(k)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, entry = await self._entry(key)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k, entry = await self._entry(key)
+        entry.data = dict(data)
+        self._mark_dirty(k)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, entry = await self._entry(key)
+        return dict(entry.data)
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        # В BaseStorage это get_data + set_data с await между ними: два хендлера одного чата
+        # (сообщение и нажатие кнопки) затёрли бы изменения друг друга. Здесь запись правится
+        # на месте без await после _entry — несохранённая запись у всех одна (см. _pinned).
+        k, entry = await self._entry(key)
+        entry.data = {**entry.data, **data}
+        self._mark_dirty(k)
+        return dict(entry.data)
+
+    def _read_states(self) -> dict[str, Optional[str]]:
+        with self._db_lock:
+            return dict(self._connect().execute("SELECT key, state FROM fsm").fetchall())
+
+    async def counts_by_state(self) -> dict[Optional[str], int]:
+        """Сколько диалогов в каждом состоянии (по данным SQLite плюс несброшенные изменения)."""
+        counts: dict[Optional[str], int] = {}
+        # полный проход по таблице — в потоке, чтобы опрос /metrics не останавливал event loop
+        states = await asyncio.to_thread(self._read_states)
+        for k in self._dirty:
+            entry = self._hot.get(k)
+            if entry is not None:
+                states[k] = entry.state
+        for state in states.values():
+            if state is not None:
+                counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    async def close(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        try:
+            await self.flush()
+        finally:
+            if self._conn is not None:
+                with self._db_lock:
+                    self._conn.close()
+                self._conn = None
+
+
+def build_storage() -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE."""
+    spec = os.getenv("FSM_STORAGE", "").strip() or "sqlite:" + os.path.join("media", "cache", "fsm.sqlite3")
+    kind, _, path = spec.partition(":")
+    kind = kind.strip().lower()
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "sqlite":
+        return SQLiteStorage(
+            path or os.path.join("media", "cache", "fsm.sqlite3"),
+            flush_interval=_env_num("FSM_FLUSH_INTERVAL", 0.2),
+            hot_ttl=_env_num("FSM_HOT_TTL", 0 if os.getenv("BOT_MODE", "").strip().lower() == "webhook" else 30),
+            hot_size=int(_env_num("FSM_HOT_SIZE", 10000)),
+        )
+    raise ValueError(f"Неизвестный FSM_STORAGE: {spec!r}")
@@ -0,0 +1,162 @@
+import os
+import re
+import copy
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# ===== Кэш готовых толкований =====
+# Одинаковый вопрос + тот же расклад + те же карты в том же порядке и положении
+# дают одинаковый запрос к модели — такой ответ можно отдать из кэша.
+#
+# INTERP_CACHE_SIZE = сколько толкований держать в памяти (по умолчанию 512, 0 — выключить кэш)
+# INTERP_CACHE_TTL  = время жизни записи, сек (по умолчанию 7 суток)
+# INTERP_CACHE_DB   = путь к SQLite для дискового уровня (пусто — только память)
+# ===================================
+
+PURGE_INTERVAL = 3600  # как часто удалять просроченные записи из SQLite, сек
+
+_SPACES = re.compile(r"\s+")
+_EDGE_PUNCT = "«»\"'“”„.,!?…:;—- "
+
+
+def normalize_question(question: str) -> str:
+    """Приводим вопрос к каноническому виду: регистр, ё/е, пробелы, кавычки и знаки по краям."""
+    q = (question or "").lower().replace("ё", "е")
+    q = _SPACES.sub(" ", q)
+    return q.strip(_EDGE_PUNCT)
+
+
+def cache_key(question: str, spread_title: str, cards: list[tuple[str, bool]]) -> str:
+    """Ключ: нормализованный вопрос + название расклада + упорядоченные (карта, перевёрнута)."""
+    raw = json.dumps(
+        [normalize_question(question), spread_title, [[name, bool(rev)] for name, rev in cards]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class InterpretationCache:
+    """LRU+TTL в памяти и необязательный SQLite-уровень, переживающий перезапуски."""
+
+    def __init__(self, max_size: int = 512, ttl: float = 7 * 24 * 3600, db_path: str | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._mem: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()     # память
+        self._db_lock = threading.Lock()  # SQLite (работает в потоках asyncio.to_thread)
+        self._purged_at = 0.0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._db: sqlite3.Connection | None = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS interpretations "
+                "(key TEXT PRIMARY KEY, created REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _remember(self, key: str, created: float, value: dict):
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_size:
+            self._mem.popitem(last=False)
+
+    async def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry and now - entry[0] <= self.ttl:
+                self._mem.move_to_end(key)
+                self.stats["hits"] += 1
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._mem[key]
+
+        if self._db is not None:
+            # SQLite — в потоке, чтобы не останавливать event loop
+            row = await asyncio.to_thread(self._read_disk, key)
+            if row and now - row[0] <= self.ttl:
+                value = json.loads(row[1])
+                with self._lock:
+                    self._remember(key, row[0], value)
+                    self.stats["disk_hits"] += 1
+                return copy.deepcopy(value)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: dict):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, copy.deepcopy(value))
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._write_disk, key, now, json.dumps(value, ensure_ascii=False))
+            except sqlite3.Error as e:
+                logger.warning("Interpretation cache write failed: %s", e)  # в памяти запись уже есть
+
+    def _read_disk(self, key: str) -> tuple[float, str] | None:
+        with self._db_lock:
+            return self._db.execute("SELECT created, value FROM interpretations WHERE key = ?", (key,)).fetchone()
+
+    def _write_disk(self, key: str, now: float, value: str):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO interpretations (key, created, value) VALUES (?, ?, ?)",
+                (key, now, value),
+            )
+            # просроченные записи чистим не на каждой записи, а раз в PURGE_INTERVAL
+            if now - self._purged_at >= PURGE_INTERVAL:
+                self._db.execute("DELETE FROM interpretations WHERE created < ?", (now - self.ttl,))
+                self._purged_at = now
+            self._db.commit()
+
+    def snapshot(self) -> dict[str, Any]:
+        """Счётчики попаданий/промахов и текущий размер."""
+        total = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["hits"] + self.stats["disk_hits"]
+        return {
+            **self.stats,
+            "size": len(self._mem),
+            "hit_ratio": round(hits / total, 3) if total else 0.0,
+        }
+
+
+_cache: InterpretationCache | None = None
+
+
+def get_cache() -> InterpretationCache:
+    """Общий кэш процесса, настраивается через INTERP_CACHE_*."""
+    global _cache
+    if _cache is None:
+        try:
+            size = int(os.getenv("INTERP_CACHE_SIZE", "").strip() or 512)
+        except ValueError:
+            size = 512
+        try:
+            ttl = float(os.getenv("INTERP_CACHE_TTL", "").strip() or 7 * 24 * 3600)
+        except ValueError:
+            ttl = 7 * 24 * 3600
+        db_path = os.getenv("INTERP_CACHE_DB", "").strip() or None
+        _cache = InterpretationCache(max_size=size, ttl=ttl, db_path=db_path)
+    return _cache
@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+from functools import partial
+from typing import Callable
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from .sender import send
+
+# ===== Сообщение, которое дописывается по мере генерации =====
+# STREAM_EDIT_INTERVAL = минимальная пауза между правками одного сообщения, сек (по умолчанию 1.5)
+# Telegram ограничивает частоту edit_text, поэтому промежуточные правки прореживаются:
+# показываем только самую свежую версию текста не чаще раза в интервал.
+# ==============================================================
+
+# Лимит длины текста сообщения в Telegram
+MESSAGE_LIMIT = 4096
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Режет текст на сообщения не длиннее limit: по абзацам, длинный абзац — по строкам,
+    длинную строку — по пробелам. HTML-теги у нас не выходят за пределы строки, так что не рвутся.
+    """
+    chunks: list[str] = []
+    current = ""
+    for part in text.split("\n\n"):
+        pieces = [part]
+        if len(part) > limit:
+            pieces = _hard_split(part, limit)
+        for piece in pieces:
+            candidate = f"{current}\n\n{piece}" if current else piece
+            if len(candidate) <= limit:
+                current = candidate
+            else:
+                if current:
+                    chunks.append(current)
+                current = piece
+    if current:
+        chunks.append(current)
+    return chunks or [""]
+
+
+def _hard_split(text: str, limit: int) -> list[str]:
+    out: list[str] = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        out.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    out.append(text)
+    return out
+
+
+def _edit_interval() -> float:
+    try:
+        return float(os.getenv("STREAM_EDIT_INTERVAL", "").strip() or 1.5)
+    except ValueError:
+        return 1.5
+
+
+class LiveMessage:
+    """Плейсхолдер, который правится по ходу генерации, а в конце получает финальный текст."""
+
+    def __init__(self, message: Message, interval: float | None = None):
+        self.message = message
+        self.interval = _edit_interval() if interval is None else interval
+        self._last_edit = time.monotonic()
+        self._last_text = message.text or ""
+        self._pending: asyncio.Task | None = None
+
+    @classmethod
+    async def create(cls, anchor: Message, text: str, interval: float | None = None) -> "LiveMessage":
+        sent = await send(anchor.chat.id, partial(anchor.answer, text))
+        return cls(sent, interval)
+
+    async def _edit(self, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> bool:
+        try:
+            await send(self.message.chat.id, partial(self.message.edit_text, text, reply_markup=reply_markup))
+        except TelegramBadRequest as e:
+            # «message is not modified» — не ошибка, текст уже такой
+            if "not modified" not in str(e):
+                return False
+        self._last_text = text
+        self._last_edit = time.monotonic()
+        return True
+
+    async def update(self, text: str | Callable[[], str]):
+        """
+        Промежуточная правка: пропускается, если рано, текст не изменился, слишком длинный
+        или предыдущая правка ещё в очереди. Правка уходит в фоне, чтобы не тормозить чтение потока.
+        text может быть функцией — тогда она вызывается, только если правка не отброшена по времени.
+        """
+        if self._pending is not None and not self._pending.done():
+            return
+        if time.monotonic() - self._last_edit < self.interval:
+            return
+        if callable(text):
+            text = text()
+        if not text or text == self._last_text or len(text) > MESSAGE_LIMIT:
+            return
+        self._last_edit = time.monotonic()
+        self._pending = asyncio.create_task(self._edit_quietly(text))
+
+    async def _edit_quietly(self, text: str):
+        try:
+            await self._edit(text)
+        except Exception:
+            pass
+
+    async def finish(self, text: str, reply_markup: InlineKeyboardMarkup | None = None):
+        """
+        Финальная правка; если отредактировать нельзя — отправляем новым сообщением.
+        Текст длиннее лимита Telegram уходит несколькими сообщениями, кнопки — под последним.
+        """
+        if self._pending is not None and not self._pending.done():
+            await self._pending
+        chunks = split_message(text)
+        chat_id = self.message.chat.id
+        edited = False
+        try:
+            edited = await self._edit(chunks[0], reply_markup if len(chunks) == 1 else None)
+        except Exception:
+            pass
+        if not edited:
+            try:
+                await send(chat_id, self.message.delete)
+            except Exception:
+                pass
+        for i, chunk in enumerate(chunks[1:] if edited else chunks, start=2 if edited else 1):
+            markup = reply_markup if i == len(chunks) else None
+            await send(chat_id, partial(self.message.answer, chunk, reply_markup=markup))
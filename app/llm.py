@@ -1,27 +1,334 @@
 import os
 import json
-from typing import Any
-import httpx
-from dotenv import load_dotenv
-
-# Загружаем .env сразу при импорте
-load_dotenv()
-
-SYSTEM_PROMPT = (
-    "Ты — профессиональный таролог студии White Fox. Твоя задача — давать глубокие, но лаконичные "
-    "интерпретации карт Таро в контексте конкретного вопроса и позиции в раскладе.\n\n"
-    "Стиль: умный, спокойный, честный, без мистики. Пиши как внимательный собеседник, а не прорицатель.\n\n"
-    "Для каждой карты опирайся на:\n"
-    "- её название, положение (прямое или перевёрнутое), и тезисы (если есть),\n"
-    "- значение позиции в раскладе (например, «Прошлое», «Совет», «Что мешает» и т.п.),\n"
-    "- общий вопрос пользователя.\n\n"
-    "Формат ответа — только JSON:\n"
-    "{ 'cards': [ { 'position': '...', 'name': '...', 'meaning': '... (3–5 предложений, контекстно, по позиции)' } ],"
-    "  'summary': '... (3–6 предложений — общий ответ, синтезируя все карты)' }\n\n"
-    "Не используй эзотерических клише, не повторяй одно и то же. Пиши осмысленно и естественно."
+import logging
+import weakref
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+
+from .interp_cache import cache_key, get_cache
+from .meanings_store import get_meaning_store
+from .llm_dispatch import CircuitOpen, Overloaded, get_dispatcher, mark_first_token
+from .metrics import JSON_PARSE_SECONDS, LLM_ERRORS, LLM_FALLBACKS, LLM_SECONDS
+from .prompt_builder import Prompt, log_usage, reading_prompt, summary_prompt
+from .tracing import span
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# ===== HTTP-клиент к модели (один на всё приложение) =====
+# LLM_MAX_CONNECTIONS   = максимум соединений в пуле (по умолчанию 20)
+# LLM_MAX_KEEPALIVE     = сколько простаивающих соединений держать (по умолчанию 10)
+# LLM_KEEPALIVE_EXPIRY  = через сколько секунд закрывать простаивающее соединение (30)
+# LLM_HTTP2             = 1 — включить HTTP/2 (нужен пакет h2: pip install "httpx[http2]")
+# LLM_CONNECT_TIMEOUT   = таймаут на установку соединения, сек (5)
+# LLM_READ_TIMEOUT      = таймаут на чтение ответа, сек (40)
+# ==========================================================
+
+_client: "httpx.AsyncClient | None" = None
+
+# Счётчики для pool_stats(): сколько запросов ушло и сколько из них открыли новое соединение
+_stats = {"requests": 0, "new_connections": 0}
+_seen_streams: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+async def _count_connection(response: "httpx.Response"):
+    """Хук httpx: отличаем новое соединение от переиспользованного по сетевому потоку."""
+    _stats["requests"] += 1
+    stream = response.extensions.get("network_stream")
+    if stream is None:
+        return
+    try:
+        if stream not in _seen_streams:
+            _seen_streams.add(stream)
+            _stats["new_connections"] += 1
+    except TypeError:
+        # поток не поддерживает weakref — считаем соединение новым
+        _stats["new_connections"] += 1
+
+
+def init_http_client() -> "httpx.AsyncClient":
+    """Создаёт общий клиент с пулом соединений (при первом запросе к модели)."""
+    global _client
+    if _client is not None:
+        return _client
+    import httpx  # тяжёлый импорт — только когда клиент действительно нужен
+
+    http2 = os.getenv("LLM_HTTP2", "").strip().lower() in ("1", "true", "yes")
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("LLM_HTTP2 включён, но пакет h2 не установлен — используем HTTP/1.1")
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=int(_env_num("LLM_MAX_CONNECTIONS", 20)),
+        max_keepalive_connections=int(_env_num("LLM_MAX_KEEPALIVE", 10)),
+        keepalive_expiry=_env_num("LLM_KEEPALIVE_EXPIRY", 30),
+    )
+    read_timeout = _env_num("LLM_READ_TIMEOUT", 40)
+    timeout = httpx.Timeout(
+        connect=_env_num("LLM_CONNECT_TIMEOUT", 5),
+        read=read_timeout,
+        write=read_timeout,
+        pool=read_timeout,
+    )
+    _client = httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+        event_hooks={"response": [_count_connection]},
+    )
+    return _client
+
+
+def get_http_client() -> "httpx.AsyncClient":
+    """Общий клиент; если бот его ещё не создал — создаём лениво."""
+    return _client if _client is not None else init_http_client()
+
+
+async def close_http_client():
+    """Закрывает общий клиент. Вызывается при остановке бота."""
+    global _client
+    if _client is not None:
+        logger.info("LLM HTTP pool: %s", pool_stats())
+        await _client.aclose()
+        _client = None
+
+
+def pool_stats() -> dict[str, Any]:
+    """Статистика пула: запросы, новые соединения, доля переиспользования, текущие соединения."""
+    stats: dict[str, Any] = dict(_stats)
+    requests = stats["requests"]
+    stats["reused_connections"] = max(0, requests - stats["new_connections"])
+    stats["reuse_ratio"] = round(stats["reused_connections"] / requests, 3) if requests else 0.0
+
+    # Текущее состояние пула httpcore (внутренние атрибуты — читаем осторожно)
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    stats["open_connections"] = len(connections)
+    stats["idle_connections"] = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+    return stats
+
+def api_url(path: str = "/chat/completions") -> str:
+    """Адрес OpenAI-совместимого API; OPENAI_BASE_URL позволяет подставить локальный сервер."""
+    base = os.getenv("OPENAI_BASE_URL", "").strip().rstrip("/") or "https://api.openai.com/v1"
+    return base + path
+
+
+async def chat_completion(
+    messages: list[dict],
+    max_tokens: int,
+    temperature: float = 0.6,
+    usage: dict | None = None,
+) -> str:
+    """
+    Один запрос к /chat/completions. Возвращает текст ответа, ошибки пробрасывает.
+    usage — если передан, сюда записываются usage ответа и finish_reason.
+    """
+    api_key = os.getenv("OPENAI_API_KEY", "").strip()
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip()
+    res = await get_http_client().post(
+        api_url(),
+        headers={"Authorization": f"Bearer {api_key}"},
+        json={
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+    )
+    res.raise_for_status()
+    data = res.json()
+    _read_usage(data, usage)
+    return data["choices"][0]["message"]["content"]
+
+
+def _read_usage(data: dict, usage: dict | None):
+    if usage is None or not isinstance(data, dict):
+        return
+    if isinstance(data.get("usage"), dict):
+        usage.update(data["usage"])
+    for choice in data.get("choices") or []:
+        if choice.get("finish_reason"):
+            usage["finish_reason"] = choice["finish_reason"]
+
+
+async def chat_completion_stream(
+    messages: list[dict],
+    max_tokens: int,
+    on_text: Callable[[str], Awaitable[None]],
+    temperature: float = 0.6,
+    usage: dict | None = None,
+) -> str:
+    """
+    То же, что chat_completion, но с stream=True: читает SSE-поток
+    и после каждого фрагмента вызывает on_text с уже накопленным текстом.
+    usage приходит последним фрагментом (stream_options.include_usage).
+    """
+    api_key = os.getenv("OPENAI_API_KEY", "").strip()
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip()
+    parts: list[str] = []
+    other: list[str] = []  # строки не из SSE — на случай, если сервер проигнорировал stream
+    async with get_http_client().stream(
+        "POST",
+        api_url(),
+        headers={"Authorization": f"Bearer {api_key}"},
+        json={
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        },
+    ) as res:
+        res.raise_for_status()
+        async for line in res.aiter_lines():
+            if not line.startswith("data:"):
+                other.append(line)
+                continue
+            chunk = line[5:].strip()
+            if chunk == "[DONE]":
+                break
+            try:
+                data = json.loads(chunk)
+                _read_usage(data, usage)
+                delta = data["choices"][0].get("delta", {}).get("content")
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                continue
+            if delta:
+                mark_first_token()
+                parts.append(delta)
+                await on_text("".join(parts))
+    if not parts and other:
+        data = json.loads("\n".join(other))
+        _read_usage(data, usage)
+        return data["choices"][0]["message"]["content"]
+    return "".join(parts)
+
+
+def _stream_enabled() -> bool:
+    return os.getenv("LLM_STREAM", "1").strip().lower() not in ("0", "false", "no")
+
+
+async def _complete(
+    prompt: Prompt,
+    on_text: Callable[[str], Awaitable[None]] | None = None,
+    kind: str = "full",
+) -> str:
+    """
+    Потоковый запрос, если есть кому показывать прогресс, иначе обычный. kind — метка для метрик.
+    Фактический usage сверяется с оценкой промпта (app/prompt_builder.py).
+    """
+    stream = on_text is not None and _stream_enabled()
+    usage: dict = {}
+    try:
+        with LLM_SECONDS.time(kind=kind), span(
+            "llm.request", kind=kind, stream=stream, max_tokens=prompt.max_tokens,
+            estimated_tokens=prompt.estimated_tokens,
+        ) as attrs:
+            try:
+                if stream:
+                    return await chat_completion_stream(prompt.messages, prompt.max_tokens, on_text, usage=usage)
+                return await chat_completion(prompt.messages, prompt.max_tokens, usage=usage)
+            finally:
+                attrs.update({k: usage[k] for k in ("prompt_tokens", "completion_tokens", "finish_reason") if k in usage})
+    except Exception as e:
+        LLM_ERRORS.inc(type=type(e).__name__)
+        raise
+    finally:
+        if usage:
+            log_usage(kind, prompt, usage)
+
+
+def parse_partial_json(text: str) -> Any:
+    """
+    Разбирает недописанный JSON из потока: закрывает открытую строку и скобки.
+    Если хвост не разбирается (например, оборван ключ) — откатывается к последней
+    запятой вне строки. Возвращает None, если разобрать нечего.
+    """
+    t = text.strip()
+    if t.startswith("```"):
+        t = t.strip("`")
+        if t.lower().startswith("json"):
+            t = t[4:]
+    t = t.strip()
+
+    stack: list[str] = []
+    commas: list[tuple[int, tuple[str, ...]]] = []
+    in_str = esc = False
+    for i, ch in enumerate(t):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+        elif ch == ",":
+            commas.append((i, tuple(stack)))
+
+    tail = t[:-1] if esc else t
+    candidates = [tail + ('"' if in_str else "") + "".join(reversed(stack))]
+    candidates += [t[:i] + "".join(reversed(st)) for i, st in reversed(commas[-3:])]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=4)
+def _partial_reading(text: str) -> dict[str, Any]:
+    """Частичный ответ {"cards", "summary"} из недописанного JSON потока."""
+    so_far = parse_partial_json(text)
+    if not isinstance(so_far, dict):
+        return {"cards": [], "summary": ""}
+    cards = so_far.get("cards")
+    return {
+        "cards": [c for c in cards if isinstance(c, dict)] if isinstance(cards, list) else [],
+        "summary": so_far.get("summary") if isinstance(so_far.get("summary"), str) else "",
+    }
+
+
+DEGRADED_SUMMARY = (
+    "Сейчас слишком много раскладов, и подробное толкование недоступно. "
+    "Показываем краткие значения карт — попробуйте задать вопрос чуть позже."
 )
 
 
+def _degraded(cards_payload: list[dict]) -> dict[str, Any]:
+    """Упрощённый ответ без модели: краткие тезисы карт из колоды."""
+    cards = []
+    for c in cards_payload:
+        theses = c.get("theses") or {}
+        meaning = theses.get("reversed" if c.get("reversed") else "upright", "") if isinstance(theses, dict) else ""
+        cards.append({
+            "position": c.get("position", ""),
+            "name": c.get("name", "") + (" (перевёрнутая)" if c.get("reversed") else ""),
+            "meaning": meaning,
+        })
+    return {"cards": cards, "summary": DEGRADED_SUMMARY}
+
+
 def _strip_code_fences(text: str) -> str:
     """Удаляем обёртку ```json ... ``` если модель так ответила."""
     t = text.strip()
@@ -36,14 +343,21 @@ async def build_interpretation(
     spread_title: str,
     pairs: list[Any],
     position_hints: list[str] | None = None,
+    spread_id: str | None = None,
+    on_progress: Callable[[Callable[[], dict[str, Any]]], Awaitable[None]] | None = None,
+    on_queued: Callable[[int], Awaitable[None]] | None = None,
 ) -> dict[str, Any]:
     """
     pairs — список словарей: {"position","name","reversed","theses":{upright,reversed}} (или старый формат кортежей)
+    spread_id — если задан и в хранилище значений есть все карты, модель пишет только итог
+    on_progress — по мере генерации получает функцию без аргументов, возвращающую частичный ответ
+                  {"cards", "summary"}; недописанный JSON разбирается только при её вызове, то есть
+                  когда сообщение действительно правится (LLM_STREAM=0 — выключить)
+    on_queued — получает место в очереди к модели, если запрос пришлось отложить
     """
 
-    # Читаем ключ и модель при каждом вызове
+    # Читаем ключ при каждом вызове
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
-    MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip()
 
     # 1️⃣ Без ключа — демо
     if not OPENAI_API_KEY:
@@ -62,11 +376,26 @@ async def build_interpretation(
             "summary": "Итоговый ответ (демо).",
         }
 
-    # 2️⃣ Готовим payload карт
+    # 2️⃣ Кэш готовых толкований
+    cache = get_cache()
+    key = cache_key(
+        question,
+        spread_title,
+        [
+            (item.get("name"), item.get("reversed")) if isinstance(item, dict) else (item[1], item[2])
+            for item in pairs
+        ],
+    )
+    with span("interp_cache.get"):
+        cached = await cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Готовим payload карт
     cards_payload = []
     for item in pairs:
         if isinstance(item, dict):
-            cards_payload.append(item)
+            cards_payload.append(dict(item))
         else:
             position, name, reversed_flag = item
             cards_payload.append({"position": position, "name": name, "reversed": reversed_flag})
@@ -76,63 +405,96 @@ async def build_interpretation(
         for i, hint in enumerate(position_hints):
             cards_payload[i]["hint"] = hint
 
-    user_payload = {
-        "question": question,
-        "spread_title": spread_title,
-        "cards": cards_payload,
-        "format_requirements": {
-            "type": "json",
-            "schema": {
-                "cards": [{"position": "string", "name": "string", "meaning": "string"}],
-                "summary": "string (3–6 предложений, связный ответ на вопрос пользователя)",
-            },
-            "notes": [
-                "Строго учитывай позицию и перевёрнутость.",
-                "Используй theses, если они есть.",
-                "Если hint присутствует — учти его.",
-                "Пиши кратко и по делу, без эзотерических терминов.",
-                "Верни только JSON, без текста вокруг.",
-            ],
-        },
-    }
+    # 3️⃣ Значения карт уже есть в хранилище — у модели просим только итог
+    if spread_id:
+        with span("meanings.lookup"):
+            meanings = await get_meaning_store().lookup(
+                spread_id, [(c["name"], bool(c.get("reversed"))) for c in cards_payload]
+            )
+        if meanings is not None:
+            result = await _summary_only(question, spread_title, cards_payload, meanings, on_progress, on_queued)
+            if result.pop("_ok", False):
+                await cache.set(key, result)
+            return result
 
-    prompt = (
-        "Сгенерируй толкование расклада Таро в формате JSON по схеме выше.\n"
-        "Важно: не добавляй лишнего текста — только JSON.\n"
-        f"Данные: {json.dumps(user_payload, ensure_ascii=False)}"
-    )
+    prompt = reading_prompt(question, spread_title, cards_payload)
 
-    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-    body = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt},
-        ],
-        "temperature": 0.6,
-        "max_tokens": 900,
-    }
+    async def on_text(text: str):
+        # разбор всего буфера на каждом фрагменте — O(n²); откладываем до реальной правки
+        await on_progress(partial(_partial_reading, text))
 
-    # 3️⃣ Запрос к OpenAI
+    # 4️⃣ Запрос к модели (через общую очередь с ограничением параллелизма)
     try:
-        async with httpx.AsyncClient(timeout=40) as client:
-            res = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=body,
-            )
-            res.raise_for_status()
-            data = res.json()
-            text = data["choices"][0]["message"]["content"]
+        text = await get_dispatcher().run(
+            partial(
+                _complete,
+                prompt,
+                on_text=on_text if on_progress else None,
+            ),
+            on_queued=on_queued,
+        )
+    except (Overloaded, CircuitOpen) as e:
+        LLM_ERRORS.inc(type=type(e).__name__)
+        LLM_FALLBACKS.inc(reason="degraded")
+        return _degraded(cards_payload)
     except Exception as e:
+        logger.warning("LLM interpretation failed: %s: %s", type(e).__name__, e)
+        LLM_FALLBACKS.inc(reason="error")
         return {"cards": [], "summary": f"Не удалось получить ответ от модели: {e}"}
 
-    # 4️⃣ Парсим JSON
+    # 5️⃣ Парсим JSON
     t = _strip_code_fences(text)
     try:
-        parsed = json.loads(t)
+        with JSON_PARSE_SECONDS.time(), span("llm.parse", chars=len(t)):
+            parsed = json.loads(t)
         if "cards" in parsed and "summary" in parsed and isinstance(parsed["cards"], list):
+            await cache.set(key, parsed)
             return parsed
-        return {"cards": [], "summary": t[:1500]}
     except Exception:
-        return {"cards": [], "summary": t[:1500]}
+        pass
+    logger.warning("LLM answer is not the expected JSON, showing it as summary (%d chars)", len(t))
+    LLM_FALLBACKS.inc(reason="unparsed")
+    return {"cards": [], "summary": t[:1500]}
+
+
+async def _summary_only(
+    question: str,
+    spread_title: str,
+    cards_payload: list[dict],
+    meanings: list[str],
+    on_progress: Callable[[Callable[[], dict[str, Any]]], Awaitable[None]] | None = None,
+    on_queued: Callable[[int], Awaitable[None]] | None = None,
+) -> dict[str, Any]:
+    """Собирает ответ из готовых значений карт; модель пишет только итог под вопрос."""
+    cards = [
+        {
+            "position": c.get("position", ""),
+            "name": c["name"] + (" (перевёрнутая)" if c.get("reversed") else ""),
+            "meaning": meaning,
+        }
+        for c, meaning in zip(cards_payload, meanings)
+    ]
+    prompt = summary_prompt(question, spread_title, cards)
+
+    async def on_text(text: str):
+        await on_progress(lambda: {"cards": cards, "summary": text})
+
+    try:
+        summary = await get_dispatcher().run(
+            partial(
+                _complete,
+                prompt,
+                on_text=on_text if on_progress else None,
+                kind="summary",
+            ),
+            on_queued=on_queued,
+        )
+    except (Overloaded, CircuitOpen) as e:
+        LLM_ERRORS.inc(type=type(e).__name__)
+        LLM_FALLBACKS.inc(reason="degraded")
+        return {"cards": cards, "summary": DEGRADED_SUMMARY}
+    except Exception as e:
+        logger.warning("LLM summary failed: %s: %s", type(e).__name__, e)
+        LLM_FALLBACKS.inc(reason="error")
+        return {"cards": cards, "summary": f"Не удалось получить итог от модели: {e}"}
+    return {"cards": cards, "summary": summary.strip()[:1500], "_ok": True}
@@ -0,0 +1,262 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, TypeVar
+
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# ===== Очередь запросов к модели и предохранитель =====
+# LLM_MAX_IN_FLIGHT   = сколько запросов к модели выполняется одновременно (по умолчанию 8)
+# LLM_MAX_QUEUE       = сколько запросов может ждать своей очереди (по умолчанию 32);
+#                       сверх этого — сразу упрощённый ответ без модели
+# LLM_CB_WINDOW       = окно статистики предохранителя, сек (60)
+# LLM_CB_MIN_REQUESTS = минимум запросов в окне, чтобы предохранитель мог сработать (5)
+# LLM_CB_ERROR_RATE   = доля ошибок/медленных ответов, при которой он срабатывает (0.5)
+# LLM_CB_SLOW_SECONDS = ответ дольше этого считается неудачным (20); у потокового ответа
+#                       считается время до первого фрагмента — длина текста на него не влияет
+# LLM_CB_COOLDOWN     = сколько секунд не ходить к модели после срабатывания (30)
+# =======================================================
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+# Время первого фрагмента текущего запроса: run() кладёт сюда ячейку, поток её заполняет
+_first_token: ContextVar[list | None] = ContextVar("llm_first_token", default=None)
+
+
+def mark_first_token():
+    """Вызывается потоковым запросом на первом фрагменте ответа (повторные вызовы игнорируются)."""
+    cell = _first_token.get()
+    if cell is not None and cell[0] is None:
+        cell[0] = time.monotonic()
+
+
+class Overloaded(Exception):
+    """Очередь к модели заполнена."""
+
+
+class CircuitOpen(Exception):
+    """Предохранитель разомкнут: модель недавно много ошибалась или тормозила."""
+
+
+class CircuitBreaker:
+    """
+    closed — запросы идут как обычно;
+    open — запросы сразу отклоняются до конца cooldown;
+    half_open — пропускаем один пробный запрос: успех замыкает, неудача снова размыкает.
+    """
+
+    def __init__(
+        self,
+        window: float = 60,
+        min_requests: int = 5,
+        error_rate: float = 0.5,
+        slow_seconds: float = 20,
+        cooldown: float = 30,
+    ):
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._results: deque[tuple[float, bool]] = deque()
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self.state = "half_open"
+            self._trial_in_flight = False
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def record(self, ok: bool, latency: float):
+        now = time.monotonic()
+        ok = ok and latency <= self.slow_seconds
+
+        if self.state == "half_open":
+            self._trial_in_flight = False
+            if ok:
+                self.state = "closed"
+                self._results.clear()
+            else:
+                self._open(now)
+            return
+
+        self._results.append((now, ok))
+        while self._results and now - self._results[0][0] > self.window:
+            self._results.popleft()
+        total = len(self._results)
+        failed = sum(1 for _, r in self._results if not r)
+        if self.state == "closed" and total >= self.min_requests and failed / total >= self.error_rate:
+            self._open(now)
+
+    def release_trial(self):
+        """Пробный запрос отменён, не дав результата — разрешаем следующий."""
+        if self.state == "half_open":
+            self._trial_in_flight = False
+
+    def _open(self, now: float):
+        logger.warning("LLM circuit breaker opened for %ss", self.cooldown)
+        self.state = "open"
+        self._opened_at = now
+        self._results.clear()
+
+
+class LLMDispatcher:
+    """Ограничивает число одновременных запросов к модели и длину очереди ожидания."""
+
+    def __init__(self, max_in_flight: int = 8, max_queue: int = 32, breaker: CircuitBreaker | None = None):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.breaker = breaker or CircuitBreaker()
+        self.in_flight = 0
+        self._waiters: deque[tuple[asyncio.Future, Callable[[int], Awaitable[None]] | None]] = deque()
+        self.stats = {"completed": 0, "failed": 0, "queued": 0, "rejected_overload": 0, "rejected_circuit": 0}
+
+    @classmethod
+    def from_env(cls) -> "LLMDispatcher":
+        return cls(
+            max_in_flight=int(_env_num("LLM_MAX_IN_FLIGHT", 8)),
+            max_queue=int(_env_num("LLM_MAX_QUEUE", 32)),
+            breaker=CircuitBreaker(
+                window=_env_num("LLM_CB_WINDOW", 60),
+                min_requests=int(_env_num("LLM_CB_MIN_REQUESTS", 5)),
+                error_rate=_env_num("LLM_CB_ERROR_RATE", 0.5),
+                slow_seconds=_env_num("LLM_CB_SLOW_SECONDS", 20),
+                cooldown=_env_num("LLM_CB_COOLDOWN", 30),
+            ),
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def _acquire(self, on_queued: Callable[[int], Awaitable[None]] | None):
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected_overload"] += 1
+            raise Overloaded(f"в очереди к модели уже {len(self._waiters)} запросов")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((fut, on_queued))
+        self.stats["queued"] += 1
+        try:
+            if on_queued is not None:
+                await _quietly(on_queued(len(self._waiters)))
+            # слот передаёт освободивший его запрос (in_flight не меняется)
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # слот уже передан нам — возвращаем его следующему
+                self._release()
+            else:
+                self._waiters = deque(w for w in self._waiters if w[0] is not fut)
+                self._notify_positions()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            fut, _ = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                self._notify_positions()
+                return
+        self.in_flight -= 1
+
+    def _notify_positions(self):
+        """Сообщаем ожидающим их новые места в очереди (в фоне, не задерживая обработку)."""
+        for position, (fut, on_queued) in enumerate(self._waiters, 1):
+            if on_queued is not None and not fut.done():
+                asyncio.create_task(_quietly(on_queued(position)))
+
+    async def run(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        on_queued: Callable[[int], Awaitable[None]] | None = None,
+    ) -> T:
+        """
+        Выполняет запрос к модели с учётом лимитов.
+        on_queued(position) вызывается, если пришлось встать в очередь, и при каждом сдвиге очереди.
+        Бросает Overloaded (очередь полна) или CircuitOpen (предохранитель разомкнут).
+        """
+        if not self.breaker.allow():
+            self.stats["rejected_circuit"] += 1
+            raise CircuitOpen("модель временно недоступна")
+
+        try:
+            with span("llm.queue", in_flight=self.in_flight, queued=len(self._waiters)):
+                await self._acquire(on_queued)
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+
+        started = time.monotonic()
+        first_token = [None]
+        token = _first_token.set(first_token)
+
+        def latency() -> float:
+            # для предохранителя: у потока — до первого фрагмента, иначе — весь запрос
+            return (first_token[0] or time.monotonic()) - started
+
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            self.breaker.release_trial()
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            self.breaker.record(False, latency())
+            raise
+        finally:
+            _first_token.reset(token)
+            self._release()
+
+        self.stats["completed"] += 1
+        self.breaker.record(True, latency())
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "queued_now": len(self._waiters),
+            "circuit": self.breaker.state,
+        }
+
+
+async def _quietly(coro: Awaitable[None]):
+    try:
+        await coro
+    except Exception:
+        pass
+
+
+_dispatcher: LLMDispatcher | None = None
+
+
+def get_dispatcher() -> LLMDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = LLMDispatcher.from_env()
+    return _dispatcher
@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+
+# ===== Хранилище готовых значений карт по позициям =====
+# Значение карты в раскладе зависит в основном от (карта, положение, позиция в раскладе),
+# а таких сочетаний конечное число: 78 карт × 2 положения × позиции из SPREADS.
+# Хранилище заполняется заранее (python -m app.build_meanings), а в момент расклада
+# модель пишет только итог под конкретный вопрос.
+#
+# MEANINGS_DB = путь к SQLite (по умолчанию media/cache/meanings.sqlite3).
+# Если файла нет — хранилище считается пустым и бот работает как раньше.
+# ========================================================
+
+DEFAULT_DB = os.path.join("media", "cache", "meanings.sqlite3")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meanings ("
+    " spread_id TEXT NOT NULL,"
+    " position INTEGER NOT NULL,"
+    " card TEXT NOT NULL,"
+    " reversed INTEGER NOT NULL,"
+    " meaning TEXT NOT NULL,"
+    " model TEXT,"
+    " created REAL NOT NULL,"
+    " PRIMARY KEY (spread_id, position, card, reversed)"
+    ")"
+)
+
+
+class MeaningStore:
+    """Индекс значений: (spread_id, номер позиции, карта, перевёрнута) → текст."""
+
+    def __init__(self, path: str, create: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        if create:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if create or os.path.exists(path):
+            self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(_SCHEMA)
+            self._conn.commit()
+
+    @property
+    def available(self) -> bool:
+        return self._conn is not None
+
+    def get(self, spread_id: str, position: int, card: str, reversed_: bool) -> str | None:
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT meaning FROM meanings WHERE spread_id = ? AND position = ? AND card = ? AND reversed = ?",
+                (spread_id, position, card, int(bool(reversed_))),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _lookup(self, spread_id: str, cards: list[tuple[str, bool]]) -> list[str] | None:
+        if self._conn is None or not cards:
+            return None
+        keys = [(position, card, int(bool(reversed_))) for position, (card, reversed_) in enumerate(cards)]
+        values = ", ".join(["(?, ?, ?)"] * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT position, card, reversed, meaning FROM meanings "
+                f"WHERE spread_id = ? AND (position, card, reversed) IN (VALUES {values})",
+                (spread_id, *(v for key in keys for v in key)),
+            ).fetchall()
+        found = {(position, card, reversed_): meaning for position, card, reversed_, meaning in rows}
+        result = [found.get(key) for key in keys]
+        return result if all(result) else None
+
+    async def lookup(self, spread_id: str, cards: list[tuple[str, bool]]) -> list[str] | None:
+        """
+        Значения для всех карт расклада по порядку позиций; None, если хоть одного нет.
+        Один запрос на весь расклад, в потоке — чтобы SQLite не держал event loop.
+        """
+        return await asyncio.to_thread(self._lookup, spread_id, cards)
+
+    def has_all(self, spread_id: str, positions: int, card: str, reversed_: bool) -> bool:
+        """Заполнены ли все позиции расклада для карты в данном положении."""
+        if self._conn is None:
+            return False
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM meanings WHERE spread_id = ? AND card = ? AND reversed = ?",
+                (spread_id, card, int(bool(reversed_))),
+            ).fetchone()
+        return count >= positions
+
+    def put_many(self, spread_id: str, card: str, reversed_: bool, meanings: list[str], model: str = ""):
+        """Записывает значения карты для всех позиций расклада одной транзакцией."""
+        if self._conn is None:
+            raise RuntimeError(f"Хранилище значений не открыто для записи: {self.path}")
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meanings (spread_id, position, card, reversed, meaning, model, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (spread_id, position, card, int(bool(reversed_)), meaning, model, now)
+                    for position, meaning in enumerate(meanings)
+                ],
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        if self._conn is None:
+            return 0
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM meanings").fetchone()
+        return count
+
+
+_store: MeaningStore | None = None
+
+
+def get_meaning_store() -> MeaningStore:
+    """Общее хранилище процесса (только чтение; файл создаёт сборщик)."""
+    global _store
+    if _store is None:
+        _store = MeaningStore(os.getenv("MEANINGS_DB", "").strip() or DEFAULT_DB)
+    return _store
@@ -0,0 +1,219 @@
+"""
+Манифест медиафайлов: что лежит в media/cards, media/spreads и media/ui.
+
+Запуск:
+    python -m app.media_manifest [--check]
+
+Для каждого файла записывает путь, размер, mtime, sha256 и размеры картинки
+в media/manifest.json. Бот загружает манифест при старте и дальше ищет картинки
+по словарю, не трогая файловую систему на каждый клик. Если файлы поменялись
+после сборки манифеста, при старте это видно (один os.scandir на каталог):
+изменённые файлы переописываются на лету, а в лог пишется предупреждение.
+
+--check — ничего не записывать, только сверить манифест с диском (код выхода 1 при расхождении).
+
+MEDIA_MANIFEST = путь к манифесту (по умолчанию media/manifest.json)
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+MEDIA_ROOT = "media"
+MEDIA_DIRS = ("cards", "spreads", "ui")
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+DEFAULT_MANIFEST = os.path.join(MEDIA_ROOT, "manifest.json")
+MANIFEST_VERSION = 1
+
+
+def manifest_path() -> str:
+    return os.getenv("MEDIA_MANIFEST", "").strip() or DEFAULT_MANIFEST
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _dimensions(path: str) -> tuple[int, int] | None:
+    from PIL import Image  # нужен только при описании файла, не при загрузке манифеста
+
+    try:
+        with Image.open(path) as img:  # читает только заголовок
+            return img.size
+    except Exception:
+        return None
+
+
+def describe(path: str, st: os.stat_result | None = None) -> dict:
+    """Запись манифеста для одного файла."""
+    st = st or os.stat(path)
+    size = _dimensions(path)
+    return {
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "sha256": _sha256(path),
+        "width": size[0] if size else None,
+        "height": size[1] if size else None,
+    }
+
+
+def _scan(root: str = MEDIA_ROOT) -> dict[str, os.stat_result]:
+    """Картинки из MEDIA_DIRS: {путь: stat}. Один os.scandir на каталог."""
+    found: dict[str, os.stat_result] = {}
+    for sub in MEDIA_DIRS:
+        directory = os.path.join(root, sub)
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTS:
+                found[os.path.join(directory, entry.name)] = entry.stat()
+    return found
+
+
+def build_manifest(root: str = MEDIA_ROOT) -> dict:
+    files = {path: describe(path, st) for path, st in sorted(_scan(root).items())}
+    return {"version": MANIFEST_VERSION, "generated_at": time.time(), "files": files}
+
+
+def _same(entry: dict, st: os.stat_result) -> bool:
+    return entry.get("size") == st.st_size and entry.get("mtime") == st.st_mtime
+
+
+class MediaIndex:
+    """Словарь медиафайлов: поиск картинки по каталогу и имени без обращения к диску."""
+
+    def __init__(self, files: dict[str, dict], missing: list[str] | None = None, changed: list[str] | None = None):
+        self.files = {os.path.normpath(p): e for p, e in files.items()}
+        self.missing = missing or []   # есть в манифесте, но нет на диске
+        self.changed = changed or []   # появились или изменились после сборки манифеста
+        # ("cards", "1") -> [media/cards/1.png, ...] в порядке IMAGE_EXTS
+        self._by_stem: dict[tuple[str, str], list[str]] = {}
+        for path in sorted(self.files, key=lambda p: IMAGE_EXTS.index(os.path.splitext(p)[1].lower())):
+            sub = os.path.basename(os.path.dirname(path))
+            stem = os.path.splitext(os.path.basename(path))[0]
+            self._by_stem.setdefault((sub, stem), []).append(path)
+
+    @classmethod
+    def load(cls, path: str | None = None, root: str = MEDIA_ROOT) -> "MediaIndex":
+        """Манифест, сверенный с текущим содержимым каталогов."""
+        path = path or manifest_path()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            recorded = manifest.get("files", {}) if manifest.get("version") == MANIFEST_VERSION else {}
+        except FileNotFoundError:
+            logger.warning("Media manifest %s not found, describing files at startup (run python -m app.media_manifest)", path)
+            recorded = {}
+        except (OSError, ValueError) as e:
+            logger.warning("Media manifest %s unreadable (%s), describing files at startup", path, e)
+            recorded = {}
+
+        on_disk = _scan(root)
+        files: dict[str, dict] = {}
+        changed: list[str] = []
+        for p, st in on_disk.items():
+            entry = recorded.get(p)
+            if entry is not None and _same(entry, st):
+                files[p] = entry
+            else:
+                files[p] = describe(p, st)
+                changed.append(p)
+        missing = sorted(p for p in recorded if p not in on_disk)
+        if recorded and (changed or missing):
+            logger.warning(
+                "Media manifest is stale: %d new/changed, %d missing files (run python -m app.media_manifest)",
+                len(changed), len(missing),
+            )
+        return cls(files, missing=missing, changed=sorted(changed))
+
+    def find(self, sub: str, *stems: str) -> str:
+        """Первая картинка media/{sub}/{stem}.{png,jpg,jpeg} по порядку stems, иначе ""."""
+        for stem in stems:
+            paths = self._by_stem.get((sub, str(stem)))
+            if paths:
+                return paths[0]
+        return ""
+
+    def exists(self, path: str) -> bool:
+        """Есть ли файл. Для путей вне манифеста (например, свой CARD_BG_PATH) — обычная проверка диска."""
+        if not path:
+            return False
+        norm = os.path.normpath(path)
+        if norm in self.files:
+            return True
+        if os.path.basename(os.path.dirname(norm)) in MEDIA_DIRS and os.path.dirname(os.path.dirname(norm)) == MEDIA_ROOT:
+            return False
+        return os.path.exists(path)
+
+    def entry(self, path: str) -> dict | None:
+        return self.files.get(os.path.normpath(path)) if path else None
+
+
+_index: MediaIndex | None = None
+
+
+def get_media() -> MediaIndex:
+    global _index
+    if _index is None:
+        _index = MediaIndex.load()
+    return _index
+
+
+def report_missing_assets() -> list[str]:
+    """Чего не хватает колоде и раскладам; вызывается при старте бота."""
+    from .deck import DECK
+    from .spreads import SPREADS
+    from .utils import _render_params
+
+    media = get_media()
+    problems = [f"нет картинки карты {c.id} «{c.name}»" for c in DECK if not c.image_path]
+    problems += [f"нет схемы расклада {s.id}" for s in SPREADS if not media.find("spreads", s.id)]
+    bg_path = _render_params()[0]
+    if not media.exists(bg_path):
+        problems.append(f"нет фона карт {bg_path} — карты будут без фона")
+    problems += [f"файл из манифеста пропал: {p}" for p in media.missing]
+    for problem in problems:
+        logger.warning("Media: %s", problem)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Собирает манифест медиафайлов")
+    parser.add_argument("--output", default=None, help="куда писать (по умолчанию MEDIA_MANIFEST или media/manifest.json)")
+    parser.add_argument("--check", action="store_true", help="только сверить манифест с диском")
+    args = parser.parse_args()
+    path = args.output or manifest_path()
+
+    if args.check:
+        logging.basicConfig(level=logging.WARNING, format="%(message)s")
+        index = MediaIndex.load(path)
+        print(f"{len(index.files)} файлов; изменились: {len(index.changed)}; пропали: {len(index.missing)}")
+        for p in index.changed:
+            print(f"  изменился/новый: {p}")
+        for p in index.missing:
+            print(f"  пропал: {p}")
+        sys.exit(1 if index.changed or index.missing else 0)
+
+    started = time.perf_counter()
+    manifest = build_manifest()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+    print(f"{len(manifest['files'])} файлов → {path} за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
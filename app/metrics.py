@@ -0,0 +1,257 @@
+import os
+import time
+import inspect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# ===== Метрики в формате Prometheus =====
+# METRICS_PORT = порт, на котором отдаётся GET /metrics (по умолчанию выключено)
+# METRICS_HOST = интерфейс (по умолчанию 127.0.0.1 — только локально)
+# В режиме app.supervisor воркер N слушает METRICS_PORT + 1 + N.
+# =========================================
+
+# Границы корзин гистограмм, сек
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0, 120.0)
+
+_REGISTRY: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # наблюдения приходят и из потоков рендера
+        _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=SLOW_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: dict[tuple, list] = {}  # key -> [счётчики по корзинам..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with HIST.time(kind="x"): ... — замеряет блок, в том числе если он упал."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        row = self._values.get(self._key(labels))
+        return row[-1] if row else 0
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                le = 'le="%s"' % _num(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(row[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {row[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Значение считается в момент опроса: collect() -> {(значения меток...): число}.
+    collect может быть async (например, ходит в SQLite через поток) — тогда значения
+    заранее собирает refresh_all(), а samples() отдаёт последний результат.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), collect: Callable[[], dict] | None = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+        self._collected: dict = {}
+
+    async def refresh(self):
+        if self.collect is None or not inspect.iscoroutinefunction(self.collect):
+            return
+        try:
+            self._collected = await self.collect()
+        except Exception:
+            logger.exception("Gauge %s collect failed", self.name)
+            self._collected = {}
+
+    def samples(self) -> list[str]:
+        if self.collect is None:
+            return []
+        if inspect.iscoroutinefunction(self.collect):
+            values = self._collected
+        else:
+            try:
+                values = self.collect()
+            except Exception:
+                logger.exception("Gauge %s collect failed", self.name)
+                return []
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(values.items())]
+
+
+async def refresh_all():
+    """Собирает значения async-метрик перед render_all()."""
+    for m in _REGISTRY:
+        if isinstance(m, Gauge):
+            await m.refresh()
+
+
+def render_all() -> str:
+    return "".join(m.render() for m in _REGISTRY)
+
+
+# ---- Метрики бота ----
+RENDER_SECONDS = Histogram("whitefox_render_seconds", "Рендер одной карты (скругление + фон)")
+MONTAGE_SECONDS = Histogram("whitefox_montage_seconds", "Сборка расклада в одну картинку")
+RENDER_CACHE = Counter(
+    "whitefox_render_cache_total",
+    "Запросы готовой картинки: hit — из кэша, shared — дождались чужого рендера, miss — рендер",
+    ["result"],
+)
+UPLOAD_SECONDS = Histogram(
+    "whitefox_photo_upload_seconds",
+    "Отправка фото в Telegram: file_id — по сохранённому id, upload — загрузка файла, album — альбом, "
+    "montage — расклад одной картинкой",
+    ["kind"],
+)
+LLM_SECONDS = Histogram("whitefox_llm_request_seconds", "Запрос к модели (без ожидания в очереди)", ["kind"])
+LLM_ERRORS = Counter("whitefox_llm_errors_total", "Ошибки запросов к модели по типу", ["type"])
+LLM_FALLBACKS = Counter(
+    "whitefox_llm_fallback_total",
+    "Ответы без толкования от модели: degraded — очередь/предохранитель, error — ошибка, unparsed — не JSON",
+    ["reason"],
+)
+LLM_TOKENS = Counter(
+    "whitefox_llm_tokens_total",
+    "Токены по usage из ответов модели: prompt, cached (часть prompt из кэша префикса), completion",
+    ["kind", "type"],
+)
+LLM_PROMPT_ESTIMATE_RATIO = Histogram(
+    "whitefox_llm_prompt_estimate_ratio",
+    "Фактические prompt_tokens / оценка перед запросом",
+    ["kind"],
+    buckets=(0.5, 0.75, 0.9, 1.0, 1.1, 1.25, 1.5, 2.0),
+)
+JSON_PARSE_SECONDS = Histogram("whitefox_json_parse_seconds", "Разбор JSON-ответа модели", buckets=FAST_BUCKETS)
+READING_SECONDS = Histogram("whitefox_reading_seconds", "Расклад целиком: от «Перетасовать» до итогового ответа", ["spread"])
+READINGS_TOTAL = Counter("whitefox_readings_total", "Расклады по исходу", ["spread", "outcome"])
+
+
+def fsm_sessions_gauge(storage) -> Gauge:
+    """Число диалогов в каждом состоянии FSM (SQLiteStorage или MemoryStorage)."""
+
+    async def collect() -> dict:
+        if hasattr(storage, "counts_by_state"):
+            counts = await storage.counts_by_state()
+        else:
+            counts = {}
+            for record in list(getattr(storage, "storage", {}).values()):
+                state = getattr(record, "state", None)
+                if state is not None:
+                    counts[state] = counts.get(state, 0) + 1
+        return {(state,): n for state, n in counts.items()}
+
+    return Gauge("whitefox_fsm_sessions", "Активные диалоги по состоянию FSM", ["state"], collect)
+
+
+async def start_metrics_server(port: int | None = None, host: str | None = None):
+    """Поднимает /metrics, если задан METRICS_PORT. Возвращает AppRunner (для cleanup) или None."""
+    if port is None:
+        raw = os.getenv("METRICS_PORT", "").strip()
+        if not raw:
+            return None
+        port = int(raw)
+    host = host or os.getenv("METRICS_HOST", "").strip() or "127.0.0.1"
+
+    from aiohttp import web  # только если метрики включены
+
+    async def metrics(request: web.Request) -> web.Response:
+        await refresh_all()
+        return web.Response(
+            body=render_all().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("Metrics on http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,98 @@
+import io
+import os
+from functools import lru_cache
+
+from .media_manifest import get_media
+from .metrics import MONTAGE_SECONDS
+from .spreads import Layout, Slot
+
+# ===== Расклад одной картинкой =====
+# Карты (готовые плитки из кэша рендера, app/render_cache.py) раскладываются по местам Layout из
+# app/spreads.py поверх фона схемы расклада. Вызывается из пула рендера (app/render.py).
+#
+# MONTAGE_CARD_HEIGHT = высота карты на картинке, px (по умолчанию 360)
+# ===================================
+
+BACKGROUND = (34, 0, 62)  # если схемы нет — тёмно-фиолетовый, как на схемах
+
+
+def _card_height() -> int:
+    try:
+        return max(64, int(os.getenv("MONTAGE_CARD_HEIGHT", "").strip() or 360))
+    except ValueError:
+        return 360
+
+
+def _bounds(layout: Layout) -> tuple[int, int, int, int]:
+    """Рамка вокруг всех мест с полями в четверть ширины карты (в пикселях схемы)."""
+    margin = min(min(s.w, s.h) for s in layout.slots) // 4
+    return (
+        min(s.x for s in layout.slots) - margin,
+        min(s.y for s in layout.slots) - margin,
+        max(s.x + s.w for s in layout.slots) + margin,
+        max(s.y + s.h for s in layout.slots) + margin,
+    )
+
+
+@lru_cache(maxsize=8)
+def _background(scheme: str, box: tuple[int, int, int, int], size: tuple[int, int]):
+    from PIL import Image
+
+    if get_media().exists(scheme):
+        try:
+            with Image.open(scheme) as im:
+                return im.convert("RGB").resize(size, Image.BILINEAR, box=box)
+        except OSError:
+            pass
+    return Image.new("RGB", size, BACKGROUND)
+
+
+@lru_cache(maxsize=32)
+def _mask(size: tuple[int, int], radius: int):
+    from PIL import Image, ImageDraw
+
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle((0, 0, size[0] - 1, size[1] - 1), radius=radius, fill=255)
+    return mask
+
+
+def _place(slot: Slot, box: tuple[int, int, int, int], scale: float) -> tuple[int, int, int, int]:
+    left = round((slot.x - box[0]) * scale)
+    top = round((slot.y - box[1]) * scale)
+    return left, top, max(1, round(slot.w * scale)), max(1, round(slot.h * scale))
+
+
+def compose(layout: Layout, tile_paths: list[str | None], quality: int = 88) -> bytes | None:
+    """
+    Собирает расклад в один JPEG. tile_paths — плитки карт по порядку позиций
+    (перевёрнутые уже повёрнуты на 180°); None — место остаётся пустым.
+    Возвращает None, если не нашлось ни одной плитки.
+    """
+    if not any(tile_paths):
+        return None
+
+    from PIL import Image  # Pillow грузим только когда действительно рендерим
+
+    with MONTAGE_SECONDS.time():
+        upright = [s for s in layout.slots if not s.rotate] or list(layout.slots)
+        scale = _card_height() / max(s.h for s in upright)
+        box = _bounds(layout)
+        size = (round((box[2] - box[0]) * scale), round((box[3] - box[1]) * scale))
+        canvas = _background(layout.scheme, box, size).copy()
+        radius = max(1, round(layout.radius * scale))
+
+        for slot, path in zip(layout.slots, tile_paths):
+            if not path:
+                continue
+            left, top, w, h = _place(slot, box, scale)
+            with Image.open(path) as tile:
+                tile = tile.convert("RGB")
+                if slot.rotate:
+                    tile = tile.rotate(slot.rotate, expand=True)
+                # reducing_gap: сначала быстрый reduce() в целое число раз, потом точный ресайз
+                tile = tile.resize((w, h), Image.LANCZOS, reducing_gap=2.0)
+            canvas.paste(tile, (left, top), _mask((w, h), radius))
+
+        out = io.BytesIO()
+        canvas.save(out, "JPEG", quality=quality, optimize=True)
+        return out.getvalue()
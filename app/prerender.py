@@ -0,0 +1,116 @@
+"""
+Предварительный рендер всех карт колоды в кэш рендера (RENDER_CACHE, см. app/render_cache.py).
+
+Запуск:
+    python -m app.prerender [--workers N] [--force] [--radius 48]
+
+Рендерит каждую карту DECK в двух вариантах (прямая и перевёрнутая на 180°)
+в нескольких процессах, пишет манифест с результатами и печатает время по картам.
+Параметры рендера берутся из тех же переменных .env, что и у бота
+(CARD_BG_PATH, CARD_SCALE, CARD_RADIUS, RENDER_PROFILE).
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from .deck import DECK
+from .encoding import get_profile
+from .utils import rounded_cache_path, rounded_image_path, _render_params
+
+MANIFEST_PATH = os.path.join("media", "cache", "prerender.json")
+
+
+def _render_one(card_id: int, name: str, source: str, radius: int, rotated: bool, force: bool) -> dict:
+    """Рендерит одну карту в дочернем процессе."""
+    out_path = rounded_cache_path(source, radius, rotated)
+    if force and os.path.exists(out_path):
+        os.remove(out_path)
+
+    cached = os.path.exists(out_path)
+    t0 = time.perf_counter()
+    result = rounded_image_path(source, radius=radius, rotated=rotated)
+    seconds = time.perf_counter() - t0
+
+    return {
+        "id": card_id,
+        "name": name,
+        "source": source,
+        "rotated": rotated,
+        "output": result,
+        "bytes": os.path.getsize(result) if result else 0,
+        "seconds": round(seconds, 4),
+        "status": "cached" if cached else ("ok" if result else "failed"),
+    }
+
+
+def prerender(workers: int | None = None, radius: int = 48, force: bool = False) -> dict:
+    """Рендерит всю колоду и возвращает манифест."""
+    bg_path, scale, radius = _render_params(radius)
+    jobs = [(c.id, c.name, c.image_path) for c in DECK if c.image_path]
+    missing = [c.id for c in DECK if not c.image_path]
+
+    started = time.perf_counter()
+    results: list[dict] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_render_one, card_id, name, source, radius, rotated, force)
+            for card_id, name, source in jobs
+            for rotated in (False, True)
+        ]
+        for fut in as_completed(futures):
+            item = fut.result()
+            results.append(item)
+            mark = "↻" if item["rotated"] else "·"
+            print(f"{mark} {item['id']:>2} {item['status']:<6} {item['seconds']:7.3f}s  {item['name']}")
+
+    results.sort(key=lambda r: (r["id"], r["rotated"]))
+    return {
+        "params": {
+            "radius": radius,
+            "scale": scale,
+            "bg_path": bg_path if os.path.exists(bg_path) else None,
+            "profile": get_profile().name,
+        },
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "missing_sources": missing,
+        "cards": results,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m app.prerender", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию — число ядер)")
+    parser.add_argument("--radius", type=int, default=48, help="радиус скругления (как в боте)")
+    parser.add_argument("--force", action="store_true", help="перерисовать даже готовые картинки")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="куда записать манифест")
+    args = parser.parse_args(argv)
+
+    manifest = prerender(workers=args.workers, radius=args.radius, force=args.force)
+
+    os.makedirs(os.path.dirname(args.manifest) or ".", exist_ok=True)
+    with open(args.manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    rendered = [r for r in manifest["cards"] if r["status"] == "ok"]
+    failed = [r for r in manifest["cards"] if r["status"] == "failed"]
+    print(
+        f"\nГотово за {manifest['total_seconds']}s: отрисовано {len(rendered)}, "
+        f"из кэша {len(manifest['cards']) - len(rendered) - len(failed)}, ошибок {len(failed)}. "
+        f"Манифест: {args.manifest}"
+    )
+    if rendered:
+        slowest = max(rendered, key=lambda r: r["seconds"])
+        avg = sum(r["seconds"] for r in rendered) / len(rendered)
+        print(f"Среднее время на карту: {avg:.3f}s, самая долгая: {slowest['name']} ({slowest['seconds']}s)")
+    if manifest["missing_sources"]:
+        print(f"Нет исходных картинок для карт: {manifest['missing_sources']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
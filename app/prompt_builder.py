@@ -0,0 +1,174 @@
+import os
+import json
+import math
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+
+from .metrics import LLM_PROMPT_ESTIMATE_RATIO, LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# ===== Сборка промптов к модели =====
+# Неизменное (роль, стиль, схема ответа, правила) — в системном сообщении, данные расклада —
+# одним JSON в сообщении пользователя. Системный промпт короткий (~350 токенов), кэш префикса
+# у провайдеров на нём не срабатывает, поэтому экономим на размере самих данных:
+# карты уходят компактно — только тезисы нужного положения, без пустых полей и пробелов в JSON.
+#
+# LLM_TOKENS_PER_CARD = бюджет ответа на одну карту, токенов (по умолчанию 220: 3–5 предложений + JSON)
+# LLM_SUMMARY_TOKENS  = бюджет на итог, токенов (по умолчанию 350)
+# LLM_MAX_TOKENS_CAP  = потолок max_tokens на один запрос (по умолчанию 4096)
+# Оценка входа — по tiktoken, если он установлен, иначе по числу символов;
+# фактический usage из ответа пишется в лог рядом с оценкой.
+# =====================================
+
+SYSTEM_PROMPT = (
+    "Ты — профессиональный таролог студии White Fox. Твоя задача — давать глубокие, но лаконичные "
+    "интерпретации карт Таро в контексте конкретного вопроса и позиции в раскладе.\n\n"
+    "Стиль: умный, спокойный, честный, без мистики. Пиши как внимательный собеседник, а не прорицатель.\n\n"
+    "Для каждой карты опирайся на:\n"
+    "- её название, положение (прямое или перевёрнутое), и тезисы (если есть),\n"
+    "- значение позиции в раскладе (например, «Прошлое», «Совет», «Что мешает» и т.п.),\n"
+    "- общий вопрос пользователя.\n\n"
+    "Данные приходят в JSON: spread_title — расклад; cards — карты по порядку позиций "
+    "(position — позиция, name — карта, reversed — перевёрнута, theses — тезисы карты в этом положении, "
+    "hint — что означает позиция); question — вопрос пользователя.\n\n"
+    "Формат ответа — только JSON, без текста вокруг:\n"
+    '{"cards": [{"position": "...", "name": "...", "meaning": "... (3–5 предложений, контекстно, по позиции)"}], '
+    '"summary": "... (3–6 предложений — связный ответ на вопрос, синтезируя все карты)"}\n\n'
+    "Строго учитывай позицию и перевёрнутость. Используй theses и hint, если они есть. "
+    "Не используй эзотерических клише, не повторяй одно и то же. Пиши осмысленно и естественно."
+)
+
+SUMMARY_PROMPT = (
+    "Ты — профессиональный таролог студии White Fox. Значения карт по позициям уже даны; "
+    "твоя задача — коротко и по делу ответить на вопрос пользователя, синтезируя расклад целиком.\n\n"
+    "Стиль: умный, спокойный, честный, без мистики и эзотерических клише.\n\n"
+    "Напиши только итог: 3–6 предложений, связный ответ на вопрос пользователя. "
+    "Без JSON и без перечисления карт."
+)
+
+MESSAGE_OVERHEAD = 4  # служебные токены на сообщение в chat-формате
+REPLY_OVERHEAD = 3    # и на начало ответа
+CYRILLIC_CHARS_PER_TOKEN = 3.5  # без tiktoken: русский текст в o200k/cl100k — примерно 3–4 символа на токен
+OTHER_CHARS_PER_TOKEN = 3.0     # латиница, цифры и JSON-разметка
+
+
+@dataclass(frozen=True)
+class Prompt:
+    messages: list[dict]
+    max_tokens: int
+    estimated_tokens: int  # оценка входа (prompt_tokens)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+def max_tokens_for(n_cards: int) -> int:
+    """Бюджет ответа растёт с числом карт: 3 карты — ~1000 токенов, 10 — ~2500."""
+    budget = _env_int("LLM_SUMMARY_TOKENS", 350) + _env_int("LLM_TOKENS_PER_CARD", 220) * max(0, n_cards)
+    return max(64, min(budget, _env_int("LLM_MAX_TOKENS_CAP", 4096)))
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    """Токенизатор tiktoken для модели; None, если пакета нет (он необязателен)."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # словарь качается при первом вызове — без сети падает
+        logger.warning("tiktoken unavailable (%s: %s), estimating tokens by characters", type(e).__name__, e)
+        return None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    enc = _encoding(model or os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip())
+    if enc is not None:
+        return len(enc.encode(text))
+    cyrillic = sum(1 for ch in text if "Ѐ" <= ch <= "ӿ")
+    return math.ceil(cyrillic / CYRILLIC_CHARS_PER_TOKEN + (len(text) - cyrillic) / OTHER_CHARS_PER_TOKEN)
+
+
+def estimate_tokens(messages: list[dict], model: str | None = None) -> int:
+    """Оценка prompt_tokens для списка сообщений."""
+    return REPLY_OVERHEAD + sum(MESSAGE_OVERHEAD + count_tokens(m.get("content", ""), model) for m in messages)
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_card(card: dict) -> dict:
+    """
+    Карта для модели: тезисы только того положения, в котором она выпала,
+    reversed — только если перевёрнута, пустые поля не отправляются.
+    """
+    out = {"position": card.get("position", ""), "name": card.get("name", "")}
+    if card.get("reversed"):
+        out["reversed"] = True
+    theses = card.get("theses")
+    if isinstance(theses, dict):
+        theses = theses.get("reversed" if card.get("reversed") else "upright")
+    if theses:
+        out["theses"] = theses
+    if card.get("hint"):
+        out["hint"] = card["hint"]
+    return out
+
+
+def reading_prompt(question: str, spread_title: str, cards: list[dict]) -> Prompt:
+    """Полное толкование: модель пишет значение каждой карты и итог."""
+    data = {"spread_title": spread_title, "cards": [compact_card(c) for c in cards], "question": question}
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Данные: {_dumps(data)}"},
+    ]
+    return Prompt(messages, max_tokens_for(len(cards)), estimate_tokens(messages))
+
+
+def summary_prompt(question: str, spread_title: str, cards: list[dict]) -> Prompt:
+    """Только итог: cards — уже готовые {"position", "name", "meaning"}."""
+    data = {"spread_title": spread_title, "cards": cards, "question": question}
+    messages = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Данные: {_dumps(data)}"},
+    ]
+    return Prompt(messages, max_tokens_for(0), estimate_tokens(messages))
+
+
+def log_usage(kind: str, prompt: Prompt, usage: dict) -> None:
+    """Сверяет фактический usage из ответа модели с оценкой; обрезанный ответ — предупреждение."""
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    if usage.get("finish_reason") == "length":
+        logger.warning(
+            "LLM %s answer truncated at max_tokens=%d (prompt %s tokens)", kind, prompt.max_tokens, prompt_tokens
+        )
+    if prompt_tokens is None:
+        return  # сервер не вернул usage
+    LLM_TOKENS.inc(prompt_tokens, kind=kind, type="prompt")
+    LLM_TOKENS.inc(cached, kind=kind, type="cached")
+    LLM_TOKENS.inc(completion_tokens or 0, kind=kind, type="completion")
+    if prompt.estimated_tokens:
+        LLM_PROMPT_ESTIMATE_RATIO.observe(prompt_tokens / prompt.estimated_tokens, kind=kind)
+    logger.info(
+        "LLM %s usage: prompt %d (estimated %d, %+.0f%%, cached %d), completion %s of max %d",
+        kind,
+        prompt_tokens,
+        prompt.estimated_tokens,
+        (prompt_tokens / prompt.estimated_tokens - 1) * 100 if prompt.estimated_tokens else 0,
+        cached,
+        completion_tokens,
+        prompt.max_tokens,
+    )
@@ -0,0 +1,41 @@
+import asyncio
+
+# ===== Активные расклады по чатам =====
+# Расклад состоит из фоновых задач (открытие карт, запрос толкования).
+# Если пользователь нажал «Новый расклад» посреди расклада — задачи отменяются,
+# чтобы не тратить запрос к модели и не досылать карты в уже закрытый расклад.
+# =======================================
+
+
+class ActiveReadings:
+    def __init__(self):
+        self._by_chat: dict[int, set[asyncio.Task]] = {}
+
+    def track(self, chat_id: int, task: asyncio.Task) -> asyncio.Task:
+        """Запоминает задачу расклада; по завершении она сама убирается из реестра."""
+        tasks = self._by_chat.setdefault(chat_id, set())
+        tasks.add(task)
+
+        def _done(t: asyncio.Task):
+            tasks.discard(t)
+            if not tasks and self._by_chat.get(chat_id) is tasks:
+                del self._by_chat[chat_id]
+            # забираем исключение, чтобы asyncio не ругался «exception was never retrieved»
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(_done)
+        return task
+
+    def cancel(self, chat_id: int) -> int:
+        """Отменяет все задачи расклада в чате. Возвращает число отменённых."""
+        tasks = list(self._by_chat.get(chat_id, ()))
+        for t in tasks:
+            t.cancel()
+        return len(tasks)
+
+    def __len__(self) -> int:
+        return sum(len(t) for t in self._by_chat.values())
+
+
+READINGS = ActiveReadings()
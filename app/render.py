@@ -0,0 +1,78 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from .media_manifest import get_media
+from .metrics import RENDER_CACHE, RENDER_SECONDS
+from .render_cache import get_render_cache
+from .utils import rounded_cache_path, rounded_image_path
+
+# ===== Асинхронный рендер карт =====
+# RENDER_WORKERS = сколько картинок рендерить одновременно (по умолчанию 2)
+# Pillow отпускает GIL на декодировании/ресайзе/сжатии, поэтому хватает потоков.
+# ===================================
+
+_executor: ThreadPoolExecutor | None = None
+
+# Рендеры «в полёте»: путь в кэше → общий future.
+# Ключ уже содержит исходник, фон, радиус, масштаб, поворот и профиль (см. rounded_cache_path).
+_inflight: dict[str, asyncio.Future] = {}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        try:
+            workers = int(os.getenv("RENDER_WORKERS", "").strip() or 2)
+        except ValueError:
+            workers = 2
+        _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="render")
+    return _executor
+
+
+def _timed_render(original_path: str, radius: int | None, rotated: bool) -> str | None:
+    with RENDER_SECONDS.time():
+        return rounded_image_path(original_path, radius, rotated)
+
+
+async def rounded_image_path_async(original_path: str, radius: int = None, rotated: bool = False) -> str | None:
+    """
+    То же, что rounded_image_path, но не блокирует event loop:
+    рендер идёт в ограниченном пуле потоков, а одновременные запросы
+    одной и той же картинки ждут один общий рендер.
+    """
+    if not get_media().exists(original_path):
+        return None
+
+    key = rounded_cache_path(original_path, radius, rotated)
+    if get_render_cache().hit(key):
+        RENDER_CACHE.inc(result="hit")
+        return key
+
+    fut = _inflight.get(key)
+    if fut is None:
+        RENDER_CACHE.inc(result="miss")
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(_get_executor(), _timed_render, original_path, radius, rotated)
+        _inflight[key] = fut
+        fut.add_done_callback(lambda _f: _inflight.pop(key, None))
+    else:
+        RENDER_CACHE.inc(result="shared")
+
+    # shield: отмена одного ожидающего не должна отменять общий рендер
+    return await asyncio.shield(fut)
+
+
+async def montage_async(layout, tile_paths: list[str | None]) -> bytes | None:
+    """Расклад одной картинкой (app/montage.py) в том же пуле, что и рендер карт."""
+    from .montage import compose
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), compose, layout, tile_paths)
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
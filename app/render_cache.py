@@ -0,0 +1,250 @@
+"""
+Кэш готовых картинок карт с адресацией по содержимому.
+
+Ключ — sha256 от содержимого исходника, содержимого фона и параметров рендера
+(радиус, масштаб, поворот, профиль кодирования). Заменили media/cards/14.png или
+card_bg.png — у картинки новый ключ, старый рендер больше не отдаётся и со временем
+вытесняется. Хэши файлов берутся из манифеста (app/media_manifest.py), поэтому
+расчёт ключа не читает картинки с диска — только stat: если размер или mtime файла
+разошлись с манифестом (картинку заменили, пока бот работает), хэш пересчитывается
+по содержимому, и замена подхватывается без перезапуска.
+
+Размер кэша ограничен: при превышении бюджета удаляются давно не использованные файлы (LRU).
+
+    python -m app.render_cache            # сколько файлов и байт в кэше
+    python -m app.render_cache --prune    # ужать кэш до бюджета прямо сейчас
+"""
+import os
+import sys
+import time
+import fcntl
+import hashlib
+import logging
+import argparse
+import threading
+
+from .media_manifest import _same, _sha256, get_media
+
+logger = logging.getLogger(__name__)
+
+# ===== Настройки кэша рендера =====
+# RENDER_CACHE        = local:media/cache/renders (по умолчанию) — каталог одной реплики
+#                       shared:/mnt/whitefox/renders — общий каталог нескольких реплик (NFS и т.п.):
+#                       перед вытеснением каталог пересканируется под flock, чтобы учесть чужие файлы
+# RENDER_CACHE_MAX_MB = бюджет кэша, МБ (по умолчанию 512)
+# ===================================
+
+DEFAULT_CACHE = "local:" + os.path.join("media", "cache", "renders")
+RENDER_VERSION = 2  # поднять, если меняется сам алгоритм рендера
+TOUCH_INTERVAL = 3600  # как часто обновлять mtime при попадании — это и есть «последнее использование»
+PRUNE_TO = 0.9  # вытесняем с запасом, чтобы не чистить на каждой записи
+
+
+_hashes: dict[tuple, str] = {}  # (путь, размер, mtime) -> sha256 для файлов вне манифеста
+
+
+def _file_hash(path: str) -> str:
+    """
+    sha256 файла: из манифеста, если размер и mtime совпадают с записанными, иначе — с диска
+    (свой CARD_BG_PATH вне media/ или картинка, заменённая уже после запуска бота).
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    entry = get_media().entry(path)
+    if entry and entry.get("sha256") and _same(entry, st):
+        return entry["sha256"]
+    memo_key = (os.path.normpath(path), st.st_size, st.st_mtime)
+    digest = _hashes.get(memo_key)
+    if digest is None:
+        digest = _hashes[memo_key] = _sha256(path)
+    return digest
+
+
+def render_key(source: str, bg_path: str | None, params: dict) -> str:
+    """Ключ рендера: содержимое исходника + содержимое фона + параметры."""
+    h = hashlib.sha256()
+    h.update(f"v{RENDER_VERSION}\0{_file_hash(source)}\0".encode())
+    h.update((_file_hash(bg_path) if bg_path else "-").encode())
+    for name in sorted(params):
+        h.update(f"\0{name}={params[name]}".encode())
+    return h.hexdigest()[:32]
+
+
+class DirectoryCache:
+    """
+    Файлы в одном каталоге: {имя исходника}-{ключ}{расширение}.
+    Запись атомарная (временный файл + os.replace), время последнего использования — mtime.
+    """
+
+    def __init__(self, root: str, max_bytes: int, shared: bool = False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._index: dict[str, list] | None = None  # имя -> [размер, mtime]
+        self._bytes = 0
+
+    def path_for(self, key: str, stem: str, ext: str) -> str:
+        return os.path.join(self.root, f"{stem}-{key}{ext}")
+
+    def _scan(self) -> dict[str, list]:
+        index = {}
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return index
+        for entry in entries:
+            # .prune.lock и недописанные .tmp — не картинки кэша
+            if entry.is_file() and not entry.name.startswith(".") and not entry.name.endswith(".tmp"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue  # удалил другой процесс
+                index[entry.name] = [st.st_size, st.st_mtime]
+        return index
+
+    def _ensure_index(self):
+        if self._index is None:
+            self._index = self._scan()
+            self._bytes = sum(size for size, _ in self._index.values())
+
+    def hit(self, path: str) -> bool:
+        """Есть ли файл; при попадании отмечает использование."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        now = time.time()
+        if now - st.st_mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+            with self._lock:
+                if self._index is not None and os.path.basename(path) in self._index:
+                    self._index[os.path.basename(path)][1] = now
+        return True
+
+    def put(self, path: str, data: bytes) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            self._ensure_index()
+            name = os.path.basename(path)
+            old = self._index.get(name)
+            self._bytes += len(data) - (old[0] if old else 0)
+            self._index[name] = [len(data), time.time()]
+            over = self._bytes > self.max_bytes
+        if over:
+            self.prune()
+        return path
+
+    def prune(self) -> int:
+        """Удаляет давно не использованные файлы, пока кэш не станет меньше бюджета. Возвращает число удалённых."""
+        with self._lock:
+            if self.shared:
+                return self._prune_shared()
+            self._ensure_index()
+            return self._evict()
+
+    def _prune_shared(self) -> int:
+        # Каталог общий: другие реплики добавляли и удаляли файлы — смотрим на диск заново.
+        # flock — чтобы реплики не вытесняли одновременно (на NFS нужен lockd).
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".prune.lock"), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0  # чистит другая реплика
+            try:
+                self._index = self._scan()
+                self._bytes = sum(size for size, _ in self._index.values())
+                return self._evict()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _evict(self) -> int:
+        if self._bytes <= self.max_bytes:
+            return 0
+        target = self.max_bytes * PRUNE_TO
+        removed = 0
+        for name, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._bytes <= target:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            del self._index[name]
+            self._bytes -= size
+            removed += 1
+        if removed:
+            logger.info("Render cache: evicted %d files, %.1f MB left", removed, self._bytes / 1024 / 1024)
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._index = self._scan()
+            self._bytes = sum(size for size, _ in self._index.values())
+            return {"root": self.root, "shared": self.shared, "files": len(self._index),
+                    "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def cache_from_spec(spec: str, max_bytes: int) -> DirectoryCache:
+    """Разбирает строку вида 'local:path' или 'shared:path'."""
+    kind, _, path = spec.partition(":")
+    kind = kind.strip().lower()
+    if kind not in ("local", "shared"):
+        raise ValueError(f"Неизвестный RENDER_CACHE: {spec!r}")
+    if kind == "shared" and not path:
+        raise ValueError("RENDER_CACHE=shared: нужен путь к общему каталогу")
+    return DirectoryCache(path or os.path.join("media", "cache", "renders"), max_bytes, shared=kind == "shared")
+
+
+_cache: DirectoryCache | None = None
+
+
+def get_render_cache() -> DirectoryCache:
+    global _cache
+    if _cache is None:
+        try:
+            max_mb = float(os.getenv("RENDER_CACHE_MAX_MB", "").strip() or 512)
+        except ValueError:
+            max_mb = 512
+        spec = os.getenv("RENDER_CACHE", "").strip() or DEFAULT_CACHE
+        _cache = cache_from_spec(spec, int(max_mb * 1024 * 1024))
+    return _cache
+
+
+def main(argv: list[str] | None = None) -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m app.render_cache", description="Состояние кэша рендера")
+    parser.add_argument("--prune", action="store_true", help="ужать кэш до бюджета RENDER_CACHE_MAX_MB")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    cache = get_render_cache()
+    stats = cache.stats()
+    if args.prune:
+        cache.prune()
+        stats = cache.stats()
+    print(
+        f"{stats['root']} ({'shared' if stats['shared'] else 'local'}): {stats['files']} файлов, "
+        f"{stats['bytes'] / 1024 / 1024:.1f} из {stats['max_bytes'] / 1024 / 1024:.1f} МБ"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import os
+from functools import lru_cache
+
+from .encoding import EncodingProfile
+
+# ===== Рендер карты сразу в размер выдачи =====
+# Старый путь (utils.compose_card) декодирует исходник целиком в RGBA и держит несколько
+# полноразмерных буферов: маску, прозрачный холст, фон, уменьшенную копию — и только потом
+# профиль кодирования ужимает результат до max_edge. Здесь всё считается в итоговом размере:
+#   - исходник декодируется с draft() (JPEG) и уменьшается через reduce() с одного шага;
+#   - фон кэшируется один на профиль, маска скругления — по размеру карты (у колоды 13
+#     разных размеров, плюс повёрнутые варианты и профили — кэш масок держит их все);
+#   - альфа-смешивание карты с фоном — Image.paste по маске или одной операцией над
+#     массивами NumPy; оба в итоговом размере.
+#
+# RENDER_BLEND = paste (по умолчанию) | numpy
+#   На колоде numpy не быстрее paste, а временные uint16-массивы поднимают пик памяти,
+#   поэтому по умолчанию paste. Сравнение со старым путём: python benchmarks/render_engine.py
+# ===============================================
+
+try:  # NumPy необязателен
+    import numpy as np
+except ImportError:  # pragma: no cover - зависит от окружения
+    np = None
+
+SUPERSAMPLE = 4  # маска рисуется крупнее и уменьшается — гладкие края, как у старого пути
+
+
+def output_geometry(src_size: tuple[int, int], scale: float, max_edge: int | None):
+    """
+    Размер выдачи, размер и позиция карты на ней. Совпадает со старым путём:
+    холст размером с исходник, карта scale по центру, затем всё уменьшено до max_edge.
+    """
+    w, h = src_size
+    k = min(1.0, max_edge / max(w, h)) if max_edge else 1.0
+    out = (max(1, round(w * k)), max(1, round(h * k)))
+    card = (max(1, round(int(w * scale) * k)), max(1, round(int(h * scale) * k)))
+    pos = ((out[0] - card[0]) // 2, (out[1] - card[1]) // 2)
+    return out, card, pos, k * scale
+
+
+@lru_cache(maxsize=64)  # с 8 кэш вытеснялся почти на каждой карте колоды
+def rounded_mask(size: tuple[int, int], radius: int):
+    """Маска скругления (L) для карты размера size; одна на все карты этого размера."""
+    from PIL import Image, ImageDraw
+
+    w, h = size
+    mask = Image.new("L", size, 255)
+    r = max(0, min(radius, min(w, h) // 2))
+    if r == 0:
+        return mask
+    # Сглаживаем только угол: четверть круга с запасом рисуется крупнее и уменьшается,
+    # потом отражается в остальные три угла — без полноразмерного буфера в SUPERSAMPLE² раз больше
+    big = Image.new("L", (r * SUPERSAMPLE, r * SUPERSAMPLE), 0)
+    ImageDraw.Draw(big).ellipse((0, 0, 2 * r * SUPERSAMPLE, 2 * r * SUPERSAMPLE), fill=255)
+    corner = big.reduce(SUPERSAMPLE)
+    mask.paste(corner, (0, 0))
+    mask.paste(corner.transpose(Image.Transpose.FLIP_LEFT_RIGHT), (w - r, 0))
+    mask.paste(corner.transpose(Image.Transpose.FLIP_TOP_BOTTOM), (0, h - r))
+    mask.paste(corner.transpose(Image.Transpose.ROTATE_180), (w - r, h - r))
+    return mask  # общая на потоки рендера — только читаем
+
+
+@lru_cache(maxsize=4)
+def _background_base(bg_path: str, mtime: float, max_edge: int | None):
+    """Фон, один раз уменьшенный до max_edge профиля. mtime — сброс кэша при замене файла."""
+    from PIL import Image
+
+    with Image.open(bg_path) as bg:
+        bg.draft("RGB", (max_edge, max_edge) if max_edge else bg.size)
+        base = bg.convert("RGB")
+    if max_edge and max(base.size) > max_edge:
+        k = max_edge / max(base.size)
+        base = base.resize((round(base.width * k), round(base.height * k)), Image.LANCZOS, reducing_gap=3.0)
+    return base
+
+
+def background(bg_path: str | None, size: tuple[int, int], max_edge: int | None):
+    """
+    Новый холст размера size с фоном (белый, если фона нет). Фон растягивается из
+    закэшированной уменьшенной копии — дёшево, и один кэш на все размеры карт.
+    """
+    from PIL import Image
+
+    if bg_path:
+        try:
+            base = _background_base(bg_path, os.path.getmtime(bg_path), max_edge)
+            return base.resize(size, Image.BILINEAR)
+        except OSError:
+            pass
+    return Image.new("RGB", size, (255, 255, 255))
+
+
+def _load_card(original_path: str, size: tuple[int, int], rotated: bool):
+    """Исходник сразу в размере карты на выдаче; draft/reduce избавляют от полноразмерных копий."""
+    from PIL import Image
+
+    with Image.open(original_path) as src:
+        src.draft("RGB", size)  # JPEG декодируется сразу с уменьшением в 2/4/8 раз; PNG — без эффекта
+        im = src if src.mode == "RGB" else src.convert("RGB")
+        card = im.resize(size, Image.LANCZOS, reducing_gap=2.0)
+    if rotated:
+        card = card.transpose(Image.Transpose.ROTATE_180)
+    return card
+
+
+def _blend_numpy(canvas, card, mask, pos: tuple[int, int]):
+    from PIL import Image
+
+    x, y = pos
+    w, h = card.size
+    out = np.array(canvas)
+    del canvas
+    region = out[y:y + h, x:x + w]
+    a = np.asarray(mask, dtype=np.uint16)[..., None]
+    # card*a + bg*(255-a) ≤ 255*255 — помещается в uint16; считаем на месте, без лишних временных массивов
+    acc = np.asarray(card, dtype=np.uint16)
+    acc *= a
+    a = 255 - a
+    a = region * a
+    acc += a
+    del a
+    acc += 127
+    acc //= 255
+    region[...] = acc
+    return Image.fromarray(out, "RGB")
+
+
+def _blend_pil(canvas, card, mask, pos: tuple[int, int]):
+    canvas.paste(card, pos, mask)
+    return canvas
+
+
+def render_card(
+    original_path: str,
+    radius: int,
+    rotated: bool,
+    bg_path: str | None,
+    scale: float,
+    profile: EncodingProfile,
+    use_numpy: bool | None = None,
+):
+    """
+    Карта на фоне в размере выдачи профиля (RGB). Вызывающий проверяет, что исходник есть.
+    use_numpy=None — по RENDER_BLEND (numpy — только если NumPy установлен).
+    """
+    from PIL import Image
+
+    with Image.open(original_path) as probe:  # только заголовок
+        src_size = probe.size
+    # без фона карта занимает весь кадр на белой подложке, как в старом пути
+    scale = max(0.1, min(scale, 1.0)) if bg_path else 1.0
+    out_size, card_size, pos, k = output_geometry(src_size, scale, profile.max_edge)
+    card = _load_card(original_path, card_size, rotated)
+    mask = rounded_mask(card_size, max(0, round(radius * k)))
+    if use_numpy is None:
+        use_numpy = os.getenv("RENDER_BLEND", "").strip().lower() == "numpy"
+    blend = _blend_numpy if use_numpy and np is not None else _blend_pil
+    return blend(background(bg_path, out_size, profile.max_edge), card, mask, pos)
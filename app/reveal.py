@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from functools import partial
+
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.types import BufferedInputFile, InputMediaPhoto, Message
+
+from .file_ids import answer_photo_cached, photo_input, remember_sent
+from .metrics import UPLOAD_SECONDS
+from .render import montage_async
+from .sender import send
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Telegram принимает в альбом от 2 до 10 медиа
+ALBUM_MAX = 10
+CAPTION_MAX = 1024
+
+REVEAL_SEQUENTIAL = "sequential"  # по одной карте с паузой — «драматичное» открытие
+REVEAL_ALBUM = "album"            # все карты одним-двумя альбомами
+REVEAL_MONTAGE = "montage"        # весь расклад одной картинкой по схеме (Spread.layout)
+
+
+@dataclass
+class RevealItem:
+    caption: str           # подпись для пошагового открытия
+    album_caption: str     # короткая подпись внутри альбома
+    photo_path: str | None  # готовая картинка или None (тогда только текст)
+
+
+async def _send_one(message: Message, item: RevealItem, caption: str):
+    chat_id = message.chat.id
+    if item.photo_path:
+        try:
+            await send(chat_id, partial(answer_photo_cached, message, item.photo_path, caption=caption))
+            return
+        except Exception as e:
+            logger.warning("Card photo %s not sent, falling back to text: %s", item.photo_path, e)
+    await send(chat_id, partial(message.answer, caption))
+
+
+async def reveal_sequential(message: Message, items: list[RevealItem], delay: float = 0.15):
+    """Отправляет карты по одной с небольшой паузой."""
+    for item in items:
+        await _send_one(message, item, item.caption)
+        with span("reveal.pacing"):
+            await asyncio.sleep(delay)
+
+
+async def _timed_album(message: Message, media: list[InputMediaPhoto]) -> list[Message]:
+    with UPLOAD_SECONDS.time(kind="album"):
+        return await message.answer_media_group(media)
+
+
+async def _send_album(message: Message, chunk: list[RevealItem]):
+    bot_id = message.bot.id
+    media = [
+        InputMediaPhoto(media=await photo_input(bot_id, it.photo_path), caption=it.album_caption)
+        for it in chunk
+    ]
+    sent = await send(message.chat.id, partial(_timed_album, message, media), cost=len(media))
+    for it, msg in zip(chunk, sent):
+        await remember_sent(bot_id, it.photo_path, msg)
+
+
+async def _flush_album(message: Message, chunk: list[RevealItem]):
+    if len(chunk) < 2:
+        # одиночное фото альбомом не отправить
+        for it in chunk:
+            await _send_one(message, it, it.album_caption)
+        return
+    try:
+        await _send_album(message, chunk)
+    except Exception as e:
+        logger.warning("Album of %d cards not sent, sending one by one: %s", len(chunk), e)
+        for it in chunk:
+            await _send_one(message, it, it.album_caption)
+
+
+async def reveal_album(message: Message, items: list[RevealItem]):
+    """
+    Отправляет карты с картинками альбомами по 10 штук.
+    Если альбом не ушёл — досылаем его карты по одной.
+    Карта без картинки уходит текстом на своём месте: накопленный альбом отправляется перед ней,
+    чтобы порядок позиций в чате совпадал с раскладом.
+    """
+    chunk: list[RevealItem] = []
+    for it in items:
+        if it.photo_path:
+            chunk.append(it)
+            if len(chunk) == ALBUM_MAX:
+                await _flush_album(message, chunk)
+                chunk = []
+            continue
+        await _flush_album(message, chunk)
+        chunk = []
+        await send(message.chat.id, partial(message.answer, it.album_caption))
+    await _flush_album(message, chunk)
+
+
+async def _timed_montage(message: Message, photo: BufferedInputFile, caption: str | None) -> Message:
+    with UPLOAD_SECONDS.time(kind="montage"):
+        return await message.answer_photo(photo, caption=caption)
+
+
+async def reveal_montage(message: Message, items: list[RevealItem], layout):
+    """
+    Одна картинка со всеми картами на местах расклада и список позиций в подписи.
+    Картинка уникальна для расклада, поэтому file_id не запоминаем.
+    Если собрать или отправить не вышло — открываем карты альбомом, но только когда
+    картинка точно не дошла: иначе пользователь увидит карты дважды.
+    """
+    chat_id = message.chat.id
+    try:
+        with span("montage.compose", cards=len(items)):
+            data = await montage_async(layout, [it.photo_path for it in items])
+    except Exception as e:
+        logger.warning("Montage not composed, falling back to album: %s", e)
+        data = None
+    if data is None:
+        await reveal_album(message, items)
+        return
+
+    caption = "\n".join(it.album_caption for it in items)
+    photo = BufferedInputFile(data, filename="spread.jpg")
+    delivered = False
+    try:
+        if len(caption) <= CAPTION_MAX:
+            await send(chat_id, partial(_timed_montage, message, photo, caption))
+            delivered = True
+        else:
+            await send(chat_id, partial(_timed_montage, message, photo, None))
+            delivered = True
+            await send(chat_id, partial(message.answer, caption))
+    except Exception as e:
+        logger.exception("Montage not sent (photo delivered: %s)", delivered)
+        if delivered:
+            return
+        if isinstance(e, TelegramNetworkError):
+            # таймаут или обрыв после загрузки: картинка могла дойти, альбом продублировал бы карты
+            await send(chat_id, partial(message.answer, caption))
+        else:
+            await reveal_album(message, items)
+
+
+async def reveal_cards(message: Message, items: list[RevealItem], mode: str = REVEAL_ALBUM, layout=None):
+    if mode == REVEAL_SEQUENTIAL:
+        await reveal_sequential(message, items)
+    elif mode == REVEAL_MONTAGE and layout is not None:
+        await reveal_montage(message, items, layout)
+    else:
+        await reveal_album(message, items)
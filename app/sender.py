@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from .tracing import Trace, current_trace
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# ===== Очередь исходящих запросов к Telegram =====
+# Все отправки из хендлеров идут через один планировщик:
+#   - общий лимит бота (~30 сообщений/с) и лимит на чат (~1 сообщение/с с небольшим запасом);
+#   - в каждом чате запросы уходят строго по очереди, в порядке постановки;
+#   - на 429 (TelegramRetryAfter) чат ждёт retry_after и повторяет тот же запрос.
+#
+# SEND_GLOBAL_RATE = сообщений в секунду на весь бот (по умолчанию 30)
+# SEND_CHAT_RATE   = запросов в секунду на один чат (по умолчанию 1)
+# SEND_CHAT_BURST  = сколько запросов в чат можно отправить подряд без паузы (по умолчанию 5)
+# SEND_MAX_RETRIES = сколько раз повторять запрос после 429 (по умолчанию 3)
+# ==================================================
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity.
+    Запрос дороже capacity ждёт полного ведра и уходит в долг — так альбом из 10 фото
+    не блокируется навсегда, а следующие запросы просто подождут дольше.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(rate, 0.001)
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, cost: float = 1.0):
+        async with self._lock:
+            need = min(cost, self.capacity)
+            self._refill()
+            while self._tokens < need:
+                await asyncio.sleep((need - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= cost
+
+
+class _Job:
+    __slots__ = ("factory", "future", "cost", "attempts", "trace", "enqueued")
+
+    def __init__(self, factory: Callable[[], Awaitable], future: asyncio.Future, cost: int):
+        self.factory = factory
+        self.future = future
+        self.cost = cost
+        self.attempts = 0
+        # воркер чата живёт в своей задаче, поэтому расклад, которому принадлежит запрос, запоминаем здесь
+        self.trace: Trace | None = current_trace()
+        self.enqueued = time.perf_counter()
+
+    @property
+    def method(self) -> str:
+        func = getattr(self.factory, "func", self.factory)
+        return getattr(func, "__name__", "call")
+
+
+class OutboundScheduler:
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 5,
+        max_retries: int = 3,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._queues: dict[int, deque[_Job]] = {}
+        self._buckets: dict[int, TokenBucket] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self.stats = {"sent": 0, "retry_after": 0, "failed": 0}
+
+    @classmethod
+    def from_env(cls) -> "OutboundScheduler":
+        return cls(
+            global_rate=_env_num("SEND_GLOBAL_RATE", 30),
+            chat_rate=_env_num("SEND_CHAT_RATE", 1),
+            chat_burst=_env_num("SEND_CHAT_BURST", 5),
+            max_retries=int(_env_num("SEND_MAX_RETRIES", 3)),
+        )
+
+    async def send(self, chat_id: int, factory: Callable[[], Awaitable[T]], cost: int = 1) -> T:
+        """
+        Ставит запрос в очередь чата и ждёт результат.
+        factory вызывается заново при каждой попытке (после 429 запрос повторяется).
+        cost — сколько сообщений создаёт запрос (для альбома — число фото).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(chat_id, deque()).append(_Job(factory, future, cost))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._run_chat(chat_id))
+        return await future
+
+    async def _run_chat(self, chat_id: int):
+        queue = self._queues[chat_id]
+        bucket = self._buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+        try:
+            while queue:
+                job = queue[0]
+                if job.future.done():
+                    # отправитель уже не ждёт (расклад отменён) — не отправляем
+                    queue.popleft()
+                    continue
+
+                # по чату считаем запросы, глобально — сообщения
+                await bucket.acquire(1)
+                await self.global_bucket.acquire(job.cost)
+                started = time.perf_counter()
+                if job.trace is not None:
+                    job.trace.add("tg.queue", job.enqueued, started - job.enqueued, method=job.method)
+                try:
+                    result = await job.factory()
+                except TelegramRetryAfter as e:
+                    job.attempts += 1
+                    self.stats["retry_after"] += 1
+                    if job.attempts > self.max_retries:
+                        queue.popleft()
+                        self.stats["failed"] += 1
+                        if not job.future.done():
+                            job.future.set_exception(e)
+                        continue
+                    logger.warning("Flood control in chat %s: retry after %ss", chat_id, e.retry_after)
+                    if job.trace is not None:
+                        job.trace.add("tg.retry_after", started, time.perf_counter() - started + e.retry_after,
+                                      method=job.method)
+                    job.enqueued = time.perf_counter() + e.retry_after
+                    # запрос остаётся первым в очереди чата — порядок сообщений сохраняется
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except Exception as e:
+                    queue.popleft()
+                    self.stats["failed"] += 1
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    continue
+
+                queue.popleft()
+                self.stats["sent"] += 1
+                if job.trace is not None:
+                    job.trace.add("tg.send", started, time.perf_counter() - started, method=job.method, cost=job.cost)
+                if not job.future.done():
+                    job.future.set_result(result)
+        finally:
+            self._workers.pop(chat_id, None)
+            if queue:
+                # воркер отменили — сообщаем оставшимся отправителям
+                while queue:
+                    job = queue.popleft()
+                    if not job.future.done():
+                        job.future.cancel()
+            self._queues.pop(chat_id, None)
+            if len(self._buckets) > 1024:
+                self._prune_buckets()
+
+    def _prune_buckets(self):
+        """Убирает вёдра неактивных чатов, которые уже восстановились полностью."""
+        for chat_id, bucket in list(self._buckets.items()):
+            if chat_id in self._workers:
+                continue
+            bucket._refill()
+            if bucket._tokens >= bucket.capacity:
+                del self._buckets[chat_id]
+
+    def pending(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+
+SENDER = OutboundScheduler.from_env()
+
+
+async def send(chat_id: int, factory: Callable[[], Awaitable[T]], cost: int = 1) -> T:
+    """Отправка через общий планировщик (см. OutboundScheduler.send)."""
+    return await SENDER.send(chat_id, factory, cost)
@@ -1,12 +1,59 @@
 from dataclasses import dataclass
 from typing import Optional, List
 
+@dataclass(frozen=True)
+class Slot:
+    """Место карты на схеме media/spreads/<id>.png, в пикселях схемы."""
+    x: int
+    y: int
+    w: int
+    h: int
+    rotate: int = 0  # 90 — карта лежит поперёк (перекрест в кельтском кресте)
+
+@dataclass(frozen=True)
+class Layout:
+    """Координаты карт для монтажа всего расклада одной картинкой (см. app/montage.py)."""
+    scheme: str          # схема, с которой сняты координаты; её фон идёт подложкой
+    slots: tuple         # Slot по порядку позиций; следующие рисуются поверх предыдущих
+    radius: int = 14     # скругление мест на схеме
+
 @dataclass
 class Spread:
     id: str
     title: str
     positions: List[str]
     hints: Optional[List[str]] = None  # краткие подсказки под каждую позицию
+    reveal: str = "album"  # "album" — карты альбомом, "sequential" — по одной, "montage" — одной картинкой
+    layout: Optional[Layout] = None  # обязателен для reveal="montage"
+
+# Места карт сняты со схем media/spreads/*.png (1920 px по ширине)
+HORSESHOE_LAYOUT = Layout(
+    scheme="media/spreads/horseshoe.png",
+    slots=tuple(Slot(x, y, 137, 237) for x, y in [
+        (1067, 482), (1067, 232), (1228, 113), (1391, 38), (1553, 113), (1715, 232), (1715, 482),
+    ]),
+)
+
+TREE_OF_LIFE_LAYOUT = Layout(
+    scheme="media/spreads/tree_of_life.png",
+    slots=tuple(Slot(x, y, 100, 173) for x, y in [
+        (1390, 75), (1316, 258), (1464, 258), (1390, 441), (1316, 624),
+        (1463, 624), (1390, 807), (1316, 990), (1463, 990), (1390, 1173),
+    ]),
+    radius=10,
+)
+
+CELTIC_LAYOUT = Layout(
+    scheme="media/spreads/celtic.png",
+    slots=(
+        Slot(1296, 607, 127, 219),
+        Slot(1250, 654, 219, 127, rotate=90),  # перекрест поверх первой карты
+        *(Slot(x, y, 127, 219) for x, y in [
+            (1296, 323), (1296, 891), (1074, 607), (1521, 607),
+            (1703, 948), (1703, 716), (1703, 484), (1703, 252),
+        ]),
+    ),
+)
 
 SPREADS: list[Spread] = [
     # 1) Путь — 3 карты
@@ -18,7 +65,8 @@ SPREADS: list[Spread] = [
             "Главная энергия твоего пути, текущее состояние.",
             "Рекомендация: что делать, куда направить усилия.",
             "Вероятный результат при выбранном направлении."
-        ]
+        ],
+        reveal="sequential",
     ),
 
     # 2) 3 карты — классика П-Н-Б
@@ -30,7 +78,8 @@ SPREADS: list[Spread] = [
             "Что привело к текущей ситуации.",
             "Текущее состояние, основная энергия.",
             "К чему всё движется."
-        ]
+        ],
+        reveal="sequential",
     ),
 
     # 3) Подкова — 7 карт
@@ -54,7 +103,9 @@ Spread(
         "Рекомендация — что делать, как поступить.",
         "Влияние среды, обстоятельств, других людей.",
         "Суммарный исход, чему всё ведёт.",
-    ]
+    ],
+    reveal="montage",
+    layout=HORSESHOE_LAYOUT,
 ),
 
 
@@ -85,7 +136,9 @@ Spread(
             "Текущее направление и жизненный путь.",
             "Что или кто поддерживает, помогает.",
             "Итог — к чему ведёт этот цикл развития."
-        ]
+        ],
+        reveal="montage",
+        layout=TREE_OF_LIFE_LAYOUT,
     ),
 
     # 5) Пирамида успеха — 6 карт
@@ -179,7 +232,9 @@ Spread(
             "Влияние окружения, людей, среды.",
             "Чего боитесь и чего ждёте от исхода.",
             "Финальный результат, возможный итог пути."
-        ]
+        ],
+        reveal="montage",
+        layout=CELTIC_LAYOUT,
     ),
 ]
 
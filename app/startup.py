@@ -0,0 +1,81 @@
+"""
+Замер времени запуска бота по фазам: импорты, .env, хранилища, медиа, первый запрос getUpdates.
+
+    python -m app.bot --startup-report          # таблица в stderr, бот продолжает работать
+    python -m app.bot --startup-report=json     # одна строка JSON в stderr
+    python -m app.bot --startup-report --startup-only   # отчёт и выход вместо polling
+
+Модуль должен импортироваться первым в app.bot, чтобы в замер попали все импорты.
+"""
+import os
+import sys
+import json
+import time
+
+# Время до импорта этого модуля (запуск интерпретатора, python -m) — по данным /proc, если есть
+def _process_age() -> float | None:
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            start_ticks = int(f.read().rsplit(b")", 1)[1].split()[19])
+        with open("/proc/uptime", "rb") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupTimer:
+    def __init__(self):
+        self.interpreter = _process_age()
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases: list[tuple[str, float]] = []
+        self.done = False
+
+    def mark(self, phase: str):
+        """Закрывает фазу: всё, что прошло с предыдущей отметки."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def total(self) -> float:
+        return self._last - self.started + (self.interpreter or 0.0)
+
+    def as_dict(self) -> dict:
+        phases = ([("interpreter", self.interpreter)] if self.interpreter is not None else []) + self.phases
+        return {
+            "phases_ms": {name: round(sec * 1000, 1) for name, sec in phases},
+            "time_to_first_poll_ms": round(self.total() * 1000, 1),
+        }
+
+    def report(self, fmt: str = "text") -> str:
+        data = self.as_dict()
+        if fmt == "json":
+            return json.dumps(data, ensure_ascii=False)
+        width = max(len(name) for name in data["phases_ms"])
+        lines = [f"  {name:<{width}}  {ms:>8.1f} ms" for name, ms in data["phases_ms"].items()]
+        lines.append(f"  {'time to first poll':<{width}}  {data['time_to_first_poll_ms']:>8.1f} ms")
+        return "Startup report:\n" + "\n".join(lines)
+
+
+STARTUP = StartupTimer()
+
+
+def first_poll_middleware(fmt: str, exit_after: bool = False):
+    """
+    Middleware сессии aiogram: на первом getUpdates закрывает замер и печатает отчёт.
+    С exit_after процесс завершается вместо реального опроса Telegram.
+    """
+    from aiogram.methods import GetUpdates
+
+    async def middleware(make_request, bot, method):
+        if isinstance(method, GetUpdates) and not STARTUP.done:
+            STARTUP.done = True
+            STARTUP.mark("start polling (getMe)")
+            print(STARTUP.report(fmt), file=sys.stderr, flush=True)
+            if exit_after:
+                # --startup-only: замер окончен, к Telegram больше не ходим
+                os._exit(0)
+        return await make_request(bot, method)
+
+    return middleware
@@ -0,0 +1,374 @@
+"""
+Многопроцессный режим: один процесс-супервизор принимает апдейты и раздаёт их
+N рабочим процессам по стабильному хэшу chat_id.
+
+Запуск:
+    python -m app.supervisor [--workers N]
+
+Все апдейты одного чата всегда попадают в один и тот же процесс. Сообщения чата внутри
+воркера обрабатываются строго по очереди, нажатия кнопок (callback_query) — сразу: иначе
+«Новый расклад» ждал бы конца идущего расклада, а ответ на нажатие успевал бы протухнуть.
+Состояние диалога (FSM) при этом не расходится: изменения в app/fsm_storage.py атомарны.
+
+Общие на бота лимиты делятся между воркерами: каждый получает SEND_GLOBAL_RATE / N
+(лимит Telegram — на бота, а не на процесс), LLM_MAX_IN_FLIGHT / N и LLM_MAX_QUEUE / N
+(не меньше 1). Лимиты на чат (SEND_CHAT_*) не делятся — чат живёт в одном воркере. Упавший воркер
+перезапускается с новой очередью; неразобранные апдейты из старой переносятся в неё.
+
+BOT_WORKERS              = число воркеров (по умолчанию — число ядер)
+BOT_MODE                 = polling (по умолчанию) или webhook — как супервизор получает апдейты
+SUPERVISOR_HEALTH_PORT   = порт /healthz в режиме polling (по умолчанию 8081)
+WORKER_HEARTBEAT_TIMEOUT = через сколько секунд без heartbeat воркер считается зависшим (по умолчанию 30)
+"""
+import os
+import time
+import zlib
+import queue
+import signal
+import asyncio
+import logging
+import argparse
+import multiprocessing as mp
+from collections import deque
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.types import Update
+from dotenv import load_dotenv
+
+from .webhook import register_webhook, serve, webhook_settings
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 5.0
+
+# Поля апдейта, в которых может лежать объект с чатом
+_UPDATE_FIELDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "callback_query", "my_chat_member", "chat_member", "chat_join_request",
+    "business_message", "edited_business_message",
+)
+
+
+def chat_id_of(update: dict) -> int | None:
+    """chat_id из «сырого» апдейта; для апдейтов без чата — id пользователя."""
+    for field in _UPDATE_FIELDS:
+        obj = update.get(field)
+        if not isinstance(obj, dict):
+            continue
+        chat = obj.get("chat") or (obj.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+        user = obj.get("from")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+    for obj in update.values():
+        if isinstance(obj, dict) and isinstance(obj.get("from"), dict):
+            return obj["from"].get("id")
+    return None
+
+
+def shard_of(chat_id: int | None, workers: int) -> int:
+    """Стабильный номер воркера: одинаковый между перезапусками и процессами."""
+    if chat_id is None:
+        return 0
+    return zlib.crc32(str(chat_id).encode()) % workers
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+def worker_budgets(workers: int) -> dict[str, str]:
+    """Доля каждого воркера в общих лимитах бота (переменные окружения для дочернего процесса)."""
+    workers = max(1, workers)
+    return {
+        "SEND_GLOBAL_RATE": f"{_env_num('SEND_GLOBAL_RATE', 30) / workers:g}",
+        "LLM_MAX_IN_FLIGHT": str(max(1, int(_env_num("LLM_MAX_IN_FLIGHT", 8)) // workers)),
+        "LLM_MAX_QUEUE": str(max(1, int(_env_num("LLM_MAX_QUEUE", 32)) // workers)),
+    }
+
+
+# ---- Воркер ----
+def _worker_main(index: int, inbox: "mp.Queue", status: "mp.Queue", budgets: dict[str, str]):
+    # остановкой управляет супервизор (он пришлёт None в очередь)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # до импорта app.bot: SENDER и диспетчер модели читают лимиты при создании;
+    # load_dotenv в app.bot не перезаписывает уже заданные переменные
+    os.environ.update(budgets)
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [worker {index}] %(name)s: %(message)s")
+    asyncio.run(_worker(index, inbox, status))
+
+
+async def _worker(index: int, inbox: "mp.Queue", status: "mp.Queue"):
+    from .bot import dp, make_bot  # app.bot сам загружает .env
+    from .llm import close_http_client
+    from .metrics import start_metrics_server
+    from .render import shutdown_executor
+    from .tracing import arm_from_env
+
+    bot = make_bot()
+    base_port = os.getenv("METRICS_PORT", "").strip()
+    metrics_runner = await start_metrics_server(int(base_port) + 1 + index) if base_port else None
+    arm_from_env()  # PROFILE_READINGS — в каждом воркере свой отчёт
+    loop = asyncio.get_running_loop()
+    tasks: set[asyncio.Task] = set()
+    chats: dict[int | None, deque] = {}  # chat_id -> апдейты, ждущие своей очереди
+    handled = 0
+
+    async def heartbeat():
+        while True:
+            status.put((index, os.getpid(), time.time(), handled, len(tasks)))
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def process(update: Update):
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            logger.exception("Update %s failed", update.update_id)
+
+    async def drain(chat_id: int | None):
+        """Сообщения одного чата — по одному: следующее начинается, когда закончилось предыдущее."""
+        backlog = chats[chat_id]
+        try:
+            while backlog:
+                await process(backlog.popleft())
+        finally:
+            del chats[chat_id]
+
+    def dispatch(chat_id: int | None, update: Update):
+        if update.callback_query is not None:
+            # кнопки — мимо очереди чата: отмена расклада не должна ждать сам расклад
+            task = asyncio.create_task(process(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            return
+        backlog = chats.get(chat_id)
+        if backlog is not None:
+            backlog.append(update)  # чат уже обрабатывается — встаём в его очередь
+            return
+        chats[chat_id] = deque([update])
+        task = asyncio.create_task(drain(chat_id))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    beat = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            data = await loop.run_in_executor(None, inbox.get)
+            if data is None:
+                break
+            update = Update.model_validate(data, context={"bot": bot})
+            dispatch(chat_id_of(data), update)
+            handled += 1
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        beat.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await dp.storage.close()
+        await close_http_client()
+        shutdown_executor()
+        await bot.session.close()
+
+
+# ---- Супервизор ----
+class Supervisor:
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._ctx = mp.get_context("spawn")
+        self.inboxes = [self._ctx.Queue() for _ in range(self.workers)]
+        self.status = self._ctx.Queue()
+        self.procs: list[mp.Process | None] = [None] * self.workers
+        self.restarts = [0] * self.workers
+        self.heartbeats: dict[int, tuple[int, float, int, int]] = {}
+        self.routed = [0] * self.workers
+        self.heartbeat_timeout = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "").strip() or 30)
+        self.budgets = worker_budgets(self.workers)
+        self._stopping = False
+
+    def start_worker(self, index: int):
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self.inboxes[index], self.status, self.budgets),
+            name=f"whitefox-worker-{index}",
+            daemon=True,
+        )
+        proc.start()
+        self.procs[index] = proc
+        self.heartbeats.pop(index, None)
+        logger.info("Worker %s started (pid %s)", index, proc.pid)
+
+    def start(self):
+        logger.info("Per-worker limits: %s", ", ".join(f"{k}={v}" for k, v in self.budgets.items()))
+        for i in range(self.workers):
+            self.start_worker(i)
+
+    def route(self, update: dict):
+        index = shard_of(chat_id_of(update), self.workers)
+        self.routed[index] += 1
+        self.inboxes[index].put(update)
+
+    def _replace_inbox(self, index: int):
+        """
+        Процесс, убитый посреди inbox.get(), может навсегда оставить за собой блокировку
+        очереди, поэтому новый воркер получает новую очередь. Что удаётся забрать из старой
+        без ожидания, переносим; остальное теряется вместе с упавшим процессом.
+        """
+        old, new = self.inboxes[index], self._ctx.Queue()
+        moved = 0
+        while True:
+            try:
+                item = old.get_nowait()
+            except (queue.Empty, OSError, EOFError):
+                break
+            if item is not None:
+                new.put(item)
+                moved += 1
+        self.inboxes[index] = new
+        if moved:
+            logger.info("Moved %d pending updates to restarted worker %s", moved, index)
+
+    def _drain_status(self):
+        while True:
+            try:
+                index, pid, ts, handled, active = self.status.get_nowait()
+            except queue.Empty:
+                return
+            self.heartbeats[index] = (pid, ts, handled, active)
+
+    async def monitor(self):
+        """Перезапускает упавшие воркеры и собирает heartbeat."""
+        while not self._stopping:
+            self._drain_status()
+            for i, proc in enumerate(self.procs):
+                if proc is not None and not proc.is_alive() and not self._stopping:
+                    logger.warning("Worker %s exited with code %s, restarting", i, proc.exitcode)
+                    self.restarts[i] += 1
+                    self._replace_inbox(i)
+                    self.start_worker(i)
+            await asyncio.sleep(1.0)
+
+    def health(self) -> dict:
+        now = time.time()
+        workers = []
+        healthy = True
+        for i, proc in enumerate(self.procs):
+            beat = self.heartbeats.get(i)
+            alive = proc is not None and proc.is_alive()
+            fresh = beat is not None and now - beat[1] <= self.heartbeat_timeout
+            ok = alive and fresh
+            healthy = healthy and ok
+            workers.append({
+                "index": i,
+                "pid": proc.pid if proc else None,
+                "alive": alive,
+                "ok": ok,
+                "last_heartbeat_age": round(now - beat[1], 1) if beat else None,
+                "handled": beat[2] if beat else 0,
+                "active": beat[3] if beat else 0,
+                "routed": self.routed[i],
+                "restarts": self.restarts[i],
+            })
+        return {"status": "ok" if healthy else "degraded", "workers": workers}
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping = True
+        for inbox in self.inboxes:
+            inbox.put(None)
+        deadline = time.monotonic() + timeout
+        for proc in self.procs:
+            if proc is not None:
+                proc.join(max(0.1, deadline - time.monotonic()))
+                if proc.is_alive():
+                    proc.terminate()
+
+
+def _health_routes(app: web.Application, sup: Supervisor):
+    async def healthz(request: web.Request) -> web.Response:
+        report = sup.health()
+        return web.json_response(report, status=200 if report["status"] == "ok" else 503)
+
+    app.router.add_get("/healthz", healthz)
+
+
+async def _poll(bot: Bot, sup: Supervisor, allowed_updates: list[str]):
+    """Long polling в супервизоре: апдейты не обрабатываются, а раздаются воркерам."""
+    await bot.delete_webhook(drop_pending_updates=False)
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.warning("get_updates failed: %s", e)
+            await asyncio.sleep(2)
+            continue
+        for update in updates:
+            sup.route(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
+
+
+async def _run(workers: int):
+    from .bot import TOKEN, dp, make_bot
+
+    if not TOKEN:
+        raise RuntimeError("Нет TG_BOT_TOKEN в .env")
+    allowed_updates = dp.resolve_used_update_types()
+
+    sup = Supervisor(workers)
+    sup.start()
+    monitor = asyncio.create_task(sup.monitor())
+    bot = make_bot()
+    app = web.Application()
+    _health_routes(app, sup)
+    try:
+        if os.getenv("BOT_MODE", "").strip().lower() == "webhook":
+            settings = webhook_settings()
+
+            async def ingest(request: web.Request) -> web.Response:
+                if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != settings["secret"]:
+                    return web.Response(status=401, text="Unauthorized")
+                sup.route(await request.json())
+                return web.Response(text="ok")
+
+            app.router.add_post(settings["path"], ingest)
+            await register_webhook(bot, settings, allowed_updates)
+            await serve(app, settings["host"], settings["port"])
+        else:
+            port = int(os.getenv("SUPERVISOR_HEALTH_PORT", "").strip() or 8081)
+            health = asyncio.create_task(serve(app, "0.0.0.0", port))
+            try:
+                await _poll(bot, sup, allowed_updates)
+            finally:
+                health.cancel()
+    finally:
+        monitor.cancel()
+        sup.stop()
+        await bot.session.close()
+
+
+def main(argv: list[str] | None = None):
+    load_dotenv()
+    # чат обслуживает один воркер — его горячий слой FSM не может устареть (см. app/fsm_storage.py)
+    os.environ.setdefault("FSM_HOT_TTL", "30")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [supervisor] %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(prog="python -m app.supervisor", description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("BOT_WORKERS", "").strip() or os.cpu_count() or 1),
+        help="число рабочих процессов",
+    )
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_run(args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import io
+import json
+import time
+import uuid
+import pstats
+import logging
+import cProfile
+import contextvars
+from contextlib import contextmanager
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# ===== Трассировка раскладов и профилировщик =====
+# Каждый расклад получает trace_id; этапы (рендер, отправка в Telegram, очередь и запрос
+# к модели, паузы между картами…) записываются как span'ы и в конце уходят в лог одной
+# JSON-строкой через логгер app.tracing.
+#
+# TRACE_READINGS   = 0 — не писать трассы в лог (по умолчанию 1)
+# PROFILE_READINGS = N — при старте включить cProfile на ближайшие N раскладов
+# PROFILE_DIR      = куда класть отчёты профилировщика (по умолчанию media/cache/profiles)
+# ADMIN_IDS        = id пользователей Telegram через запятую, которым доступна команда /profile N
+#
+# cProfile видит только поток event loop: рендер в пуле потоков попадает в отчёт как ожидание,
+# а его собственное время видно в span'ах render.
+# ==================================================
+
+_current: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("whitefox_trace", default=None)
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    v = os.getenv(name, "").strip().lower()
+    if not v:
+        return default
+    return v in ("1", "true", "yes")
+
+
+class Trace:
+    """Хронология одного расклада. Задачи, созданные внутри, наследуют trace через contextvars."""
+
+    def __init__(self, name: str, **attrs: Any):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.spans: list[dict[str, Any]] = []
+        self._token: contextvars.Token | None = None
+
+    def add(self, name: str, start: float, duration: float, **attrs: Any):
+        """start — значение time.perf_counter() в начале этапа."""
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 1),
+            "duration_ms": round(duration * 1000, 1),
+            **attrs,
+        })
+
+    def as_dict(self, **attrs: Any) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            **self.attrs,
+            **attrs,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+        }
+
+    def finish(self, **attrs: Any):
+        """Закрывает трассу, пишет её в лог и отвязывает от текущего контекста."""
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                # закрываем не в том контексте, где открывали — просто отвязываем
+                _current.set(None)
+            self._token = None
+        if _env_flag("TRACE_READINGS", True):
+            logger.info(json.dumps(self.as_dict(**attrs), ensure_ascii=False))
+
+
+def start_trace(name: str, **attrs: Any) -> Trace:
+    trace = Trace(name, **attrs)
+    trace._token = _current.set(trace)
+    return trace
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any):
+    """
+    Этап текущего расклада; вне расклада ничего не делает.
+    Отдаёт словарь атрибутов — в него можно дописать то, что стало известно по ходу этапа.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield attrs
+        return
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        trace.add(name, started, time.perf_counter() - started, **attrs)
+
+
+# ---- Профилировщик ближайших N раскладов ----
+class ReadingProfiler:
+    """
+    arm(n) — профилировать следующие n раскладов. cProfile включается на старте первого
+    и выключается, когда завершатся n раскладов, начатых после arm; отчёт пишется в PROFILE_DIR.
+    """
+
+    def __init__(self, out_dir: str | None = None):
+        self.out_dir = out_dir  # None — PROFILE_DIR из окружения на момент записи отчёта
+        self._remaining = 0
+        self._active = 0
+        self._profile: cProfile.Profile | None = None
+        self._armed_at = 0.0
+
+    @property
+    def armed(self) -> bool:
+        return self._remaining > 0 or self._profile is not None
+
+    def arm(self, readings: int) -> bool:
+        if self.armed or readings <= 0:
+            return False
+        self._remaining = readings
+        self._armed_at = time.time()
+        logger.info("Profiler armed for the next %d readings", readings)
+        return True
+
+    def reading_started(self) -> bool:
+        """Вызывается в начале расклада; True — этот расклад профилируется."""
+        if self._remaining <= 0:
+            return False
+        self._remaining -= 1
+        self._active += 1
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return True
+
+    def reading_finished(self):
+        """Вызывается в конце профилируемого расклада (и при ошибке, и при отмене)."""
+        self._active -= 1
+        if self._active > 0 or self._remaining > 0 or self._profile is None:
+            return
+        profile, self._profile = self._profile, None
+        profile.disable()
+        try:
+            path = self._dump(profile)
+            logger.info("Profiler report written to %s", path)
+        except Exception:
+            logger.exception("Profiler report not written")
+
+    def _dump(self, profile: cProfile.Profile) -> str:
+        out_dir = self.out_dir or os.getenv("PROFILE_DIR", "").strip() or os.path.join("media", "cache", "profiles")
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, time.strftime("readings-%Y%m%d-%H%M%S", time.localtime(self._armed_at)))
+        profile.dump_stats(base + ".prof")  # для snakeviz / python -m pstats
+        text = io.StringIO()
+        stats = pstats.Stats(profile, stream=text)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(60)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(30)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(text.getvalue())
+        return base + ".txt"
+
+
+PROFILER = ReadingProfiler()
+
+
+def admin_ids() -> set[int]:
+    ids = set()
+    for part in os.getenv("ADMIN_IDS", "").replace(";", ",").split(","):
+        part = part.strip()
+        if part.lstrip("-").isdigit():
+            ids.add(int(part))
+    return ids
+
+
+def arm_from_env():
+    """PROFILE_READINGS=N при старте процесса."""
+    try:
+        n = int(os.getenv("PROFILE_READINGS", "").strip() or 0)
+    except ValueError:
+        n = 0
+    if n > 0:
+        PROFILER.arm(n)
@@ -1,10 +1,12 @@
 import os
-from PIL import Image, ImageDraw
+
+from .media_manifest import get_media
 
 # ===== Настройки через .env (не обязательно) =====
 # CARD_BG_PATH   = путь к фону, например: media/ui/card_bg.png
 # CARD_SCALE     = масштаб карты поверх фона (0.9 = 90%)
 # CARD_RADIUS    = радиус скругления (по умолчанию 48)
+# RENDER_PROFILE = профиль кодирования готовых картинок (см. app/encoding.py)
 # ==================================================
 
 def md_escape(s: str) -> str:
@@ -23,9 +25,6 @@ def render_cards_md(items: list[dict]) -> str:
         lines.append(f"<b>{i}. {md_escape(pos)} — {md_escape(name)}</b>\n{md_escape(meaning)}")
     return "\n\n".join(lines)
 
-def _ensure_dir(path: str):
-    os.makedirs(path, exist_ok=True)
-
 def _env_float(name: str, default: float) -> float:
     try:
         v = float(os.getenv(name, "").strip() or default)
@@ -33,90 +32,126 @@ def _env_float(name: str, default: float) -> float:
     except Exception:
         return default
 
-def rounded_image_path(original_path: str, radius: int = None) -> str | None:
-    """
-    Готовит изображение карты для Telegram:
-      1) Скругляет углы.
-      2) Если задан фон — уменьшает карту и кладёт по центру на фоновую картинку.
-      3) Сохраняет готовый PNG в кэш: media/cache/rounded/.
-    Возвращает путь к готовому PNG или None (если не удалось).
-    """
-    if not original_path or not os.path.exists(original_path):
-        return None
-
-    # Параметры из .env
+def _render_params(radius: int = None) -> tuple[str, float, int]:
+    """Параметры рендера из .env: (путь к фону, масштаб, радиус)."""
     bg_path = os.getenv("CARD_BG_PATH", "").strip() or os.path.join("media", "ui", "card_bg.png")
     scale = _env_float("CARD_SCALE", 0.90)  # уменьшение до 90%
     if radius is None:
         # можно переопределить радиус через .env
         radius = int(_env_float("CARD_RADIUS", 48))
+    return bg_path, scale, radius
+
+def rounded_cache_path(original_path: str, radius: int = None, rotated: bool = False, profile=None) -> str:
+    """Путь в кэше рендера (app/render_cache.py), куда попадёт готовая картинка."""
+    from .encoding import get_profile
+    from .render_cache import get_render_cache, render_key
+
+    bg_path, scale, radius = _render_params(radius)
+    profile = profile or get_profile()
+
+    # ключ — содержимое исходника и фона + радиус/scale, поворот и профиль кодирования
+    key = render_key(
+        original_path,
+        bg_path if get_media().exists(bg_path) else None,
+        {"radius": radius, "scale": scale, "rotated": rotated, "profile": profile},
+    )
+    base_name = os.path.splitext(os.path.basename(original_path))[0]
+    # карта всегда на непрозрачной подложке, так что PNG вместо JPEG не понадобится
+    return get_render_cache().path_for(key, base_name, profile.extension)
 
-    # Подготовка кэша
-    cache_dir = os.path.join("media", "cache", "rounded")
-    _ensure_dir(cache_dir)
+def compose_card(original_path: str, radius: int = None, rotated: bool = False):
+    """
+    Собирает картинку карты в памяти (RGB, в размере исходника):
+      1) Скругляет углы (для перевёрнутой карты — предварительно поворачивает на 180°).
+      2) Если задан фон — уменьшает карту и кладёт по центру на фоновую картинку,
+         иначе — на белую подложку.
+    Возвращает PIL.Image или None (если не удалось).
+    Бот рендерит через app/render_engine.py; это эталон в полном размере для отчётов и бенчмарков.
+    """
+    if not original_path or not os.path.exists(original_path):
+        return None
 
-    base_name = os.path.splitext(os.path.basename(original_path))[0]
-    # учитываем в имени кэша радиус/scale и наличие фона
-    suffix = f"_r{radius}_s{int(scale*100)}"
+    bg_path, scale, radius = _render_params(radius)
     has_bg = os.path.exists(bg_path)
-    if has_bg:
-        out_name = f"{base_name}{suffix}_bg.png"
-    else:
-        out_name = f"{base_name}{suffix}.png"
-    out_path = os.path.join(cache_dir, out_name)
-
-    # Если готовый PNG уже есть — возвращаем его
-    if os.path.exists(out_path):
-        return out_path
+
+    from PIL import Image, ImageDraw  # Pillow грузим только когда действительно рендерим
 
     try:
-        with Image.open(original_path).convert("RGBA") as im:
-            w, h = im.size
-
-            # -------- 1) Скругляем углы исходной карты --------
-            mask = Image.new("L", (w, h), 0)
-            draw = ImageDraw.Draw(mask)
-            r = max(0, min(radius, min(w, h) // 2))
-            draw.rounded_rectangle((0, 0, w, h), radius=r, fill=255)
-
-            card_rgba = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-            card_rgba.paste(im, (0, 0), mask=mask)
-
-            # Если нет фона — делаем аккуратную белую подложку как раньше (для фото)
-            if not has_bg:
-                bg = Image.new("RGB", (w, h), (255, 255, 255))
-                bg.paste(card_rgba, mask=card_rgba.split()[3])  # по альфе
-                bg.save(out_path, "PNG", optimize=True)
-                return out_path
-
-            # -------- 2) Есть фон: уменьшаем карту и кладём по центру --------
-            try:
-                with Image.open(bg_path) as bg_img:
-                    # Приведём фон к размеру исходной карты, чтобы сохранить пропорции выдачи
-                    bg_resized = bg_img.convert("RGB").resize((w, h), Image.LANCZOS)
-
-                    # Масштабируем карту
-                    scale = max(0.1, min(scale, 1.0))  # безопасный диапазон
-                    new_w = max(1, int(w * scale))
-                    new_h = max(1, int(h * scale))
-                    card_small = card_rgba.resize((new_w, new_h), Image.LANCZOS)
-
-                    # Центрируем
-                    x = (w - new_w) // 2
-                    y = (h - new_h) // 2
-
-                    # Кладём карту на фон по альфе
-                    bg_resized.paste(card_small, (x, y), card_small.split()[3])
-
-                    # Сохраняем готовую композицию
-                    bg_resized.save(out_path, "PNG", optimize=True)
-                    return out_path
-            except Exception:
-                # если фон не удалось загрузить — fallback на белую подложку
-                bg = Image.new("RGB", (w, h), (255, 255, 255))
-                bg.paste(card_rgba, mask=card_rgba.split()[3])
-                bg.save(out_path, "PNG", optimize=True)
-                return out_path
+        with Image.open(original_path) as src:
+            im = src.convert("RGBA")
+        if rotated:
+            im = im.transpose(Image.Transpose.ROTATE_180)
+        w, h = im.size
+
+        # -------- 1) Скругляем углы исходной карты --------
+        mask = Image.new("L", (w, h), 0)
+        draw = ImageDraw.Draw(mask)
+        r = max(0, min(radius, min(w, h) // 2))
+        draw.rounded_rectangle((0, 0, w, h), radius=r, fill=255)
+
+        card_rgba = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+        card_rgba.paste(im, (0, 0), mask=mask)
+
+        # Если нет фона — делаем аккуратную белую подложку как раньше (для фото)
+        if not has_bg:
+            bg = Image.new("RGB", (w, h), (255, 255, 255))
+            bg.paste(card_rgba, mask=card_rgba.split()[3])  # по альфе
+            return bg
+
+        # -------- 2) Есть фон: уменьшаем карту и кладём по центру --------
+        try:
+            with Image.open(bg_path) as bg_img:
+                # Приведём фон к размеру исходной карты, чтобы сохранить пропорции выдачи
+                bg_resized = bg_img.convert("RGB").resize((w, h), Image.LANCZOS)
+
+            # Масштабируем карту
+            scale = max(0.1, min(scale, 1.0))  # безопасный диапазон
+            new_w = max(1, int(w * scale))
+            new_h = max(1, int(h * scale))
+            card_small = card_rgba.resize((new_w, new_h), Image.LANCZOS)
+
+            # Центрируем
+            x = (w - new_w) // 2
+            y = (h - new_h) // 2
+
+            # Кладём карту на фон по альфе
+            bg_resized.paste(card_small, (x, y), card_small.split()[3])
+            return bg_resized
+        except Exception:
+            # если фон не удалось загрузить — fallback на белую подложку
+            bg = Image.new("RGB", (w, h), (255, 255, 255))
+            bg.paste(card_rgba, mask=card_rgba.split()[3])
+            return bg
 
     except Exception:
         return None
+
+def rounded_image_path(original_path: str, radius: int = None, rotated: bool = False, profile=None) -> str | None:
+    """
+    Готовит изображение карты для Telegram (скругление, фон — как в compose_card, но сразу
+    в размере выдачи, см. app/render_engine.py) и сохраняет его в кэш рендера
+    (app/render_cache.py) в профиле кодирования RENDER_PROFILE (см. app/encoding.py).
+    Возвращает путь к готовой картинке или None (если не удалось).
+    """
+    from .encoding import encode, get_profile
+    from .render_cache import get_render_cache
+    from .render_engine import render_card
+
+    if not original_path or not os.path.exists(original_path):
+        return None
+
+    profile = profile or get_profile()
+
+    cache = get_render_cache()
+    out_path = rounded_cache_path(original_path, radius, rotated, profile)
+
+    # Если готовая картинка уже есть — возвращаем её
+    if cache.hit(out_path):
+        return out_path
+
+    bg_path, scale, radius = _render_params(radius)
+    try:
+        img = render_card(original_path, radius, rotated, bg_path if os.path.exists(bg_path) else None, scale, profile)
+        return cache.put(out_path, encode(img, profile))
+    except Exception:
+        return None
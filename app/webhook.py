@@ -0,0 +1,92 @@
+import os
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+# ===== Режим webhook (вместо long polling) =====
+# BOT_MODE         = polling (по умолчанию) или webhook
+# WEBHOOK_BASE_URL = публичный адрес, на который Telegram шлёт апдейты, например https://bot.example.com
+# WEBHOOK_PATH     = путь вебхука (по умолчанию /telegram/webhook)
+# WEBHOOK_SECRET   = секрет; Telegram присылает его в X-Telegram-Bot-Api-Secret-Token (обязателен)
+# WEBHOOK_HOST     = интерфейс для aiohttp (по умолчанию 0.0.0.0)
+# WEBHOOK_PORT     = порт (по умолчанию $PORT или 8080)
+# WEBHOOK_SET      = 1 — регистрировать вебхук в Telegram при старте (по умолчанию 1).
+#                    За балансировщиком с несколькими экземплярами можно оставить 1 у всех
+#                    (setWebhook идемпотентен) или регистрировать только на одном.
+#                    Общий FSM_STORAGE у экземпляров читается без кэша (FSM_HOT_TTL=0 по умолчанию
+#                    в этом режиме); на одной машине быстрее app.supervisor с BOT_MODE=webhook.
+# Здоровье экземпляра: GET /healthz
+# ================================================
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    v = os.getenv(name, "").strip().lower()
+    if not v:
+        return default
+    return v in ("1", "true", "yes")
+
+
+def build_app(bot: Bot, dp: Dispatcher, secret: str, path: str) -> web.Application:
+    """aiohttp-приложение: приём апдейтов с проверкой секрета и /healthz."""
+    app = web.Application()
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "mode": "webhook"})
+
+    app.router.add_get("/healthz", healthz)
+    # SimpleRequestHandler отвечает 401, если секрет в заголовке не совпал
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def webhook_settings() -> dict:
+    """Настройки вебхука из .env (см. шапку модуля)."""
+    settings = {
+        "base_url": os.getenv("WEBHOOK_BASE_URL", "").strip().rstrip("/"),
+        "path": os.getenv("WEBHOOK_PATH", "").strip() or "/telegram/webhook",
+        "secret": os.getenv("WEBHOOK_SECRET", "").strip(),
+        "host": os.getenv("WEBHOOK_HOST", "").strip() or "0.0.0.0",
+        "port": int(os.getenv("WEBHOOK_PORT", "").strip() or os.getenv("PORT", "").strip() or 8080),
+    }
+    if not settings["secret"]:
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_SECRET в .env")
+    return settings
+
+
+async def register_webhook(bot: Bot, settings: dict, allowed_updates: list[str]):
+    """Регистрирует вебхук в Telegram, если это не выключено через WEBHOOK_SET=0."""
+    if not _env_flag("WEBHOOK_SET", True):
+        return
+    if not settings["base_url"]:
+        raise RuntimeError("Для регистрации вебхука нужен WEBHOOK_BASE_URL в .env")
+    await bot.set_webhook(
+        settings["base_url"] + settings["path"],
+        secret_token=settings["secret"],
+        allowed_updates=allowed_updates,
+    )
+    logger.info("Webhook set to %s%s (updates: %s)", settings["base_url"], settings["path"], allowed_updates)
+
+
+async def serve(app: web.Application, host: str, port: int):
+    """Запускает aiohttp-приложение и ждёт остановки процесса."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("HTTP server listening on %s:%s", host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, allowed_updates: list[str]):
+    settings = webhook_settings()
+    await register_webhook(bot, settings, allowed_updates)
+    # вебхук в Telegram при остановке не снимаем: остальные экземпляры за балансировщиком продолжают работать
+    await serve(build_app(bot, dp, settings["secret"], settings["path"]), settings["host"], settings["port"])
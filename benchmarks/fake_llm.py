@@ -0,0 +1,87 @@
+"""
+Поддельный chat-completions сервер для бенчмарков.
+
+Отвечает на POST /v1/chat/completions в формате OpenAI (обычный JSON или SSE при "stream": true)
+с настраиваемой задержкой. Ответ собирается из «Данные: {...}» в последнем сообщении,
+поэтому годится и для полного толкования, и для короткого итога, и для build_meanings.
+Бот направляется сюда через OPENAI_BASE_URL=http://127.0.0.1:PORT/v1.
+"""
+import json
+import random
+import asyncio
+
+from aiohttp import web
+
+
+class FakeLLM:
+    def __init__(self, latency: float = 1.0, jitter: float = 0.2, chunk_delay: float = 0.01, error_rate: float = 0.0):
+        self.latency = latency          # время до первого токена, сек
+        self.jitter = jitter            # ± доля случайного разброса latency
+        self.chunk_delay = chunk_delay  # пауза между кусками SSE
+        self.error_rate = error_rate    # доля ответов 500
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._runner: web.AppRunner | None = None
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def start(self, port: int = 0):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    @staticmethod
+    def _content(body: dict) -> str:
+        user = body["messages"][-1]["content"]
+        try:
+            data = json.loads(user.split("Данные: ", 1)[1])
+        except (IndexError, ValueError):
+            data = {}
+        if "positions" in data:
+            return json.dumps({"meanings": [f"{data.get('card', '')}: {p.get('position', '')}" for p in data["positions"]]}, ensure_ascii=False)
+        if "cards" in data and not any("meaning" in c for c in data["cards"]):  # полное толкование, не только итог
+            cards = [
+                {"position": c.get("position", ""), "name": c.get("name", ""), "meaning": "Толкование карты в этой позиции. " * 3}
+                for c in data["cards"]
+            ]
+            return json.dumps({"cards": cards, "summary": "Итог расклада: " + data.get("question", "")}, ensure_ascii=False)
+        return "Итог по вопросу: " + str(data.get("question", ""))
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(0.0, self.latency * (1 + random.uniform(-self.jitter, self.jitter))))
+            if self.error_rate and random.random() < self.error_rate:
+                return web.json_response({"error": {"message": "fake failure"}}, status=500)
+            content = self._content(body)
+            usage = {"prompt_tokens": len(json.dumps(body, ensure_ascii=False)) // 3, "completion_tokens": len(content) // 3}
+            if not body.get("stream"):
+                return web.json_response({"choices": [{"message": {"content": content}, "finish_reason": "stop"}], "usage": usage})
+
+            resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await resp.prepare(request)
+            for i in range(0, len(content), 24):
+                chunk = {"choices": [{"delta": {"content": content[i:i + 24]}}]}
+                await resp.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                await asyncio.sleep(self.chunk_delay)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                await resp.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+            await resp.write(b"data: [DONE]\n\n")
+            return resp
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,109 @@
+"""
+Поддельный Bot API для бенчмарков: отвечает на методы, которые вызывает бот,
+и записывает каждый вызов. Бот направляется сюда через TG_API_SERVER=http://127.0.0.1:PORT.
+
+Апдейты для getUpdates можно подкладывать через push_update(), а за ответами бота
+следить через listeners: каждый вызывается как listener(method, params, result).
+"""
+import json
+import time
+import asyncio
+import itertools
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "WhiteFoxBench", "username": "white_fox_bench_bot"}
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency  # искусственная задержка ответа на каждый метод, сек
+        self.calls: list[tuple[float, str, dict]] = []
+        self.listeners: list = []
+        self.record_calls = True
+        self._updates: asyncio.Queue = asyncio.Queue()
+        self._message_ids = itertools.count(1000)
+        self._runner: web.AppRunner | None = None
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def push_update(self, update: dict):
+        self._updates.put_nowait(update)
+
+    async def start(self, port: int = 0):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.content_type.startswith("multipart/"):
+            params = {}
+            async for part in await request.multipart():
+                params[part.name] = await part.read() if part.filename else await part.text()
+            return params
+        if request.content_type == "application/json":
+            return await request.json()
+        return dict(await request.post())
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        if self.record_calls:
+            self.calls.append((time.perf_counter(), method, params))
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self._result(method, params)
+        for listener in self.listeners:
+            listener(method, params, result)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        timeout = float(params.get("timeout") or 0)
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self._updates.get(), timeout=min(timeout, 1.0) or 0.01))
+        except asyncio.TimeoutError:
+            return []
+        while not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **extra,
+        }
+
+    def _photo(self) -> list[dict]:
+        n = next(self._message_ids)
+        return [{"file_id": f"photo-{n}", "file_unique_id": f"u{n}", "width": 818, "height": 1409}]
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params, text=str(params.get("text", "")))
+        if method == "sendPhoto":
+            return self._message(params, photo=self._photo(), caption=str(params.get("caption", "")))
+        if method == "sendMediaGroup":
+            media = params.get("media")
+            items = json.loads(media) if isinstance(media, str) else media or []
+            return [self._message(params, photo=self._photo()) for _ in items]
+        return True
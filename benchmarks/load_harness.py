@@ -0,0 +1,317 @@
+"""
+Нагрузочный прогон бота целиком: поддельный Bot API + поддельная модель + тысячи пользователей.
+
+    python benchmarks/load_harness.py [--users 1000] [--concurrency 200] [--spread three]
+                                      [--llm-latency 1.5] [--tg-latency 0.02]
+                                      [--workers N] [--no-flood-limits] [--json report.json]
+
+Бот запускается отдельным процессом (`python -m app.bot`, а с --workers — `python -m app.supervisor`)
+и ходит в локальные сервера: TG_API_SERVER → benchmarks/fake_telegram.py,
+OPENAI_BASE_URL → benchmarks/fake_llm.py. Каждый пользователь проходит
+/start → «Задать вопрос» → вопрос → выбор расклада → «Перетасовать».
+
+Шаг считается завершённым, когда бот ответил: на сообщение — первым sendMessage в чат,
+на кнопку — answerCallbackQuery. Для расклада дополнительно меряется время до первой карты.
+В конце печатаются пропускная способность и p50/p95/p99 по каждому шагу и по раскладу целиком.
+
+По умолчанию бот работает с настоящими лимитами Telegram (SEND_GLOBAL_RATE=30 сообщений/с),
+поэтому при тысячах пользователей упираться будет именно в них; --no-flood-limits
+снимает лимиты, чтобы мерить сам бот. Без прогретого кэша карт (python -m app.prerender)
+расклад упирается в рендер.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+import statistics
+import tempfile
+
+from fake_llm import FakeLLM
+from fake_telegram import BOT_USER, FakeTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.llm import DEGRADED_SUMMARY  # noqa: E402
+from app.spreads import SPREAD_BY_ID  # noqa: E402
+
+STEPS = ("start", "ask", "question", "spread", "shuffle")
+QUESTIONS = (
+    "Что ждёт меня в работе в ближайший месяц?",
+    "Как наладить отношения с близкими?",
+    "Стоит ли менять место жительства?",
+    "На что обратить внимание на этой неделе?",
+    "Как найти своё дело?",
+)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Перцентиль по ближайшему рангу."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(p / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+class Harness:
+    def __init__(self, api: FakeTelegram, step_timeout: float):
+        self.api = api
+        self.step_timeout = step_timeout
+        self._update_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        self._waiters: dict[tuple, asyncio.Future] = {}
+        self.last_message_id: dict[int, int] = {}
+        self.last_text: dict[int, str] = {}
+        self.first_card_at: dict[int, float] = {}
+        self.latencies: dict[str, list[float]] = {name: [] for name in (*STEPS, "first_card", "reading", "journey")}
+        self.errors: dict[str, int] = {name: 0 for name in STEPS}
+        self.outcomes = {"full": 0, "degraded": 0, "error": 0}
+        api.listeners.append(self._on_call)
+
+    # ---- ответы бота ----
+    def _resolve(self, key: tuple):
+        fut = self._waiters.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_result(time.perf_counter())
+
+    def _on_call(self, method: str, params: dict, result):
+        if method == "answerCallbackQuery":
+            self._resolve(("cb", str(params.get("callback_query_id"))))
+            return
+        chat_id = int(params.get("chat_id") or 0)
+        if not chat_id:
+            return
+        messages = result if isinstance(result, list) else [result]
+        for msg in messages:
+            if isinstance(msg, dict) and "message_id" in msg:
+                self.last_message_id[chat_id] = msg["message_id"]
+        if method in ("sendMessage", "editMessageText"):
+            self.last_text[chat_id] = str(params.get("text", ""))
+        if method in ("sendPhoto", "sendMediaGroup"):
+            self.first_card_at.setdefault(chat_id, time.perf_counter())
+        if method == "sendMessage":
+            self._resolve(("chat", chat_id))
+
+    async def _wait(self, key: tuple) -> float:
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[key] = fut
+        try:
+            return await asyncio.wait_for(fut, self.step_timeout)
+        finally:
+            self._waiters.pop(key, None)
+
+    # ---- апдейты от «пользователя» ----
+    @staticmethod
+    def _user(chat_id: int) -> dict:
+        return {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        msg = {
+            "message_id": next(self._update_ids) + 10**6,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self._user(chat_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": msg}
+
+    def _callback(self, chat_id: int, data: str) -> tuple[dict, str]:
+        callback_id = str(next(self._callback_ids))
+        update = {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": callback_id,
+                "from": self._user(chat_id),
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": {
+                    "message_id": self.last_message_id.get(chat_id, 1),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "…",
+                },
+            },
+        }
+        return update, callback_id
+
+    async def _step(self, name: str, chat_id: int, update: dict, key: tuple) -> float:
+        started = time.perf_counter()
+        waiter = asyncio.create_task(self._wait(key))
+        await asyncio.sleep(0)  # ожидание регистрируется до отправки апдейта
+        self.api.push_update(update)
+        try:
+            done = await waiter
+        except asyncio.TimeoutError:
+            self.errors[name] += 1
+            raise
+        self.latencies[name].append(done - started)
+        return started
+
+    async def user(self, chat_id: int, spread_id: str, think: float):
+        journey_started = time.perf_counter()
+        try:
+            await self._step("start", chat_id, self._message(chat_id, "/start"), ("chat", chat_id))
+            await asyncio.sleep(think)
+            update, cb = self._callback(chat_id, "ask")
+            await self._step("ask", chat_id, update, ("cb", cb))
+            await asyncio.sleep(think)
+            question = f"{random.choice(QUESTIONS)} (#{chat_id})"  # разные вопросы — мимо кэша толкований
+            await self._step("question", chat_id, self._message(chat_id, question), ("chat", chat_id))
+            await asyncio.sleep(think)
+            update, cb = self._callback(chat_id, f"spread:{spread_id}")
+            await self._step("spread", chat_id, update, ("cb", cb))
+            await asyncio.sleep(think)
+            update, cb = self._callback(chat_id, f"shuffle:{spread_id}")
+            self.first_card_at.pop(chat_id, None)
+            started = await self._step("shuffle", chat_id, update, ("cb", cb))
+        except asyncio.TimeoutError:
+            self.outcomes["error"] += 1
+            return
+        now = time.perf_counter()
+        self.latencies["reading"].append(now - started)
+        self.latencies["journey"].append(now - journey_started)
+        if chat_id in self.first_card_at:
+            self.latencies["first_card"].append(self.first_card_at[chat_id] - started)
+        text = self.last_text.get(chat_id, "")
+        if "Ответ на ваш вопрос" not in text:
+            self.outcomes["error"] += 1
+        elif DEGRADED_SUMMARY[:40] in text:
+            self.outcomes["degraded"] += 1
+        else:
+            self.outcomes["full"] += 1
+
+
+def _bot_env(args, api: FakeTelegram, llm: FakeLLM, workdir: str) -> dict:
+    env = {
+        **os.environ,
+        "TG_BOT_TOKEN": "1:load-harness",
+        "TG_API_SERVER": api.url,
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": llm.url,
+        "BOT_MODE": "polling",
+        "FSM_STORAGE": "memory:",
+        "FILE_ID_STORE": "memory:",
+        "INTERP_CACHE_SIZE": "0",
+        "INTERP_CACHE_DB": "",
+        "MEANINGS_DB": os.path.join(workdir, "meanings.sqlite3"),  # пустая: каждый расклад — полный запрос к модели
+        "SUPERVISOR_HEALTH_PORT": "0",
+    }
+    if args.no_flood_limits:
+        env.update({"SEND_GLOBAL_RATE": "100000", "SEND_CHAT_RATE": "100000", "SEND_CHAT_BURST": "100000"})
+    return env
+
+
+async def run(args) -> dict:
+    api = FakeTelegram(latency=args.tg_latency)
+    api.record_calls = False
+    llm = FakeLLM(latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate)
+    await api.start()
+    await llm.start()
+    harness = Harness(api, args.step_timeout)
+
+    with tempfile.TemporaryDirectory() as workdir, open(os.path.join(workdir, "bot.log"), "wb") as log:
+        cmd = [sys.executable, "-m", "app.bot"] if not args.workers else \
+            [sys.executable, "-m", "app.supervisor", "--workers", str(args.workers)]
+        bot = await asyncio.create_subprocess_exec(
+            *cmd, cwd=ROOT, env=_bot_env(args, api, llm, workdir),
+            stdout=asyncio.subprocess.DEVNULL, stderr=log,
+        )
+        try:
+            # ждём, пока бот начнёт опрашивать getUpdates
+            await harness.user(1, args.spread, 0)
+            for v in harness.latencies.values():
+                v.clear()
+            harness.outcomes = dict.fromkeys(harness.outcomes, 0)
+
+            gate = asyncio.Semaphore(args.concurrency)
+
+            async def one(chat_id: int):
+                async with gate:
+                    await harness.user(chat_id, args.spread, args.think)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(10_000 + i) for i in range(args.users)))
+            elapsed = time.perf_counter() - started
+        finally:
+            bot.terminate()
+            try:
+                await asyncio.wait_for(bot.wait(), 15)
+            except asyncio.TimeoutError:
+                bot.kill()
+            await api.stop()
+            await llm.stop()
+            if bot.returncode not in (0, -15, None) and harness.outcomes["error"]:
+                with open(os.path.join(workdir, "bot.log"), encoding="utf-8", errors="replace") as f:
+                    print(f.read()[-3000:], file=sys.stderr)
+
+    return {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "spread": args.spread,
+        "elapsed_s": round(elapsed, 2),
+        "readings_per_s": round((harness.outcomes["full"] + harness.outcomes["degraded"]) / elapsed, 2),
+        "outcomes": harness.outcomes,
+        "step_errors": harness.errors,
+        "llm": {"requests": llm.requests, "max_in_flight": llm.max_in_flight},
+        "latency_ms": {
+            name: {
+                "n": len(values),
+                "p50": round(percentile(values, 50) * 1000, 1),
+                "p95": round(percentile(values, 95) * 1000, 1),
+                "p99": round(percentile(values, 99) * 1000, 1),
+                "max": round(max(values) * 1000, 1) if values else float("nan"),
+                "mean": round(statistics.fmean(values) * 1000, 1) if values else float("nan"),
+            }
+            for name, values in harness.latencies.items()
+        },
+    }
+
+
+def _print(report: dict):
+    print(
+        f"{report['users']} пользователей, одновременно {report['concurrency']}, расклад {report['spread']}: "
+        f"{report['elapsed_s']} с, {report['readings_per_s']} раскладов/с"
+    )
+    print(f"исходы: {report['outcomes']}; запросов к модели: {report['llm']['requests']} "
+          f"(одновременно до {report['llm']['max_in_flight']})")
+    print(f"  {'шаг':<12}{'n':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}   (мс)")
+    for name, s in report["latency_ms"].items():
+        print(f"  {name:<12}{s['n']:>7}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['max']:>10.1f}")
+    errors = {k: v for k, v in report["step_errors"].items() if v}
+    if errors:
+        print(f"таймауты по шагам: {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота с поддельными Telegram и моделью")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="сколько пользователей проходят сценарий одновременно")
+    parser.add_argument("--spread", default="three", choices=sorted(SPREAD_BY_ID))
+    parser.add_argument("--think", type=float, default=0.0, help="пауза пользователя между шагами, сек")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="время ответа модели до первого токена, сек")
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--tg-latency", type=float, default=0.02, help="задержка ответа Bot API, сек")
+    parser.add_argument("--workers", type=int, default=0, help="запустить app.supervisor с N воркерами")
+    parser.add_argument("--no-flood-limits", action="store_true", help="снять лимиты отправки бота")
+    parser.add_argument("--step-timeout", type=float, default=300)
+    parser.add_argument("--json", default="", help="сохранить отчёт в файл")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    _print(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Рендер карты: старый путь против app/render_engine.py — время на карту и пик памяти.
+
+    python benchmarks/render_engine.py [--cards 20] [--profile telegram] [--json]
+
+Каждый вариант запускается в отдельном процессе, чтобы пик RSS (ru_maxrss) не смешивался:
+  classic      — utils.compose_card (полный размер) + encoding.encode (уменьшение до профиля)
+  engine       — render_engine.render_card с NumPy
+  engine-pil   — render_engine.render_card без NumPy (Image.paste по маске)
+Пик RSS считается от уровня после импортов (Pillow, NumPy, модули бота).
+Сохранение в кэш не измеряется: результат кодируется в память.
+Последняя колонка — PSNR относительно classic на тех же картах (насколько совпадает картинка).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("classic", "engine", "engine-pil")
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: КБ
+
+
+def _child(mode: str, cards: int, profile_name: str) -> dict:
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from PIL import Image  # noqa: F401 — импорт до замера базового уровня
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        pass
+    from app.deck import DECK
+    from app.encoding import PROFILES, encode
+    from app.render_engine import render_card
+    from app.utils import _render_params, compose_card
+
+    profile = PROFILES[profile_name]
+    bg_path, scale, radius = _render_params()
+    bg_path = bg_path if os.path.exists(bg_path) else None
+    jobs = [(c.image_path, i % 2 == 1) for i, c in enumerate(c for c in DECK if c.image_path)][:cards]
+
+    baseline = _rss_mb()
+    times, sizes = [], 0
+    for path, rotated in jobs:
+        t0 = time.perf_counter()
+        if mode == "classic":
+            img = compose_card(path, radius, rotated)
+        else:
+            img = render_card(path, radius, rotated, bg_path, scale, profile, use_numpy=(mode == "engine"))
+        sizes += len(encode(img, profile))
+        times.append(time.perf_counter() - t0)
+        del img
+    return {
+        "mode": mode,
+        "cards": len(jobs),
+        "avg_ms": round(statistics.mean(times) * 1000, 1),
+        "first_ms": round(times[0] * 1000, 1),  # холодный старт: маска и фон ещё не в кэше
+        "p95_ms": round(sorted(times)[max(0, int(len(times) * 0.95) - 1)] * 1000, 1),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(_rss_mb() - baseline, 1),
+        "avg_kb": round(sizes / max(1, len(jobs)) / 1024, 1),
+    }
+
+
+def _similarity(cards: int, profile_name: str) -> dict:
+    """PSNR вывода движка относительно старого пути (после уменьшения до профиля)."""
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from app.deck import DECK
+    from app.encoding import PROFILES, _psnr, fit
+    from app.render_engine import render_card
+    from app.utils import _render_params, compose_card
+
+    profile = PROFILES[profile_name]
+    bg_path, scale, radius = _render_params()
+    bg_path = bg_path if os.path.exists(bg_path) else None
+    out = {"engine": [], "engine-pil": []}
+    for i, card in enumerate(c for c in DECK if c.image_path):
+        if i >= cards:
+            break
+        reference = fit(compose_card(card.image_path, radius, i % 2 == 1), profile)
+        for mode in out:
+            img = render_card(card.image_path, radius, i % 2 == 1, bg_path, scale, profile, use_numpy=(mode == "engine"))
+            out[mode].append(_psnr(reference, img) or 99.0)
+    return {mode: round(min(values), 2) for mode, values in out.items() if values}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cards", type=int, default=20)
+    parser.add_argument("--profile", default="telegram")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child, args.cards, args.profile)))
+        return 0
+
+    results = []
+    for mode in MODES:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, "--cards", str(args.cards), "--profile", args.profile],
+            capture_output=True, text=True, cwd=ROOT,
+        )
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            return 1
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    psnr = _similarity(min(args.cards, 5), args.profile)
+    for r in results:
+        r["min_psnr_vs_classic_db"] = psnr.get(r["mode"])
+
+    if args.json:
+        print(json.dumps({"profile": args.profile, "results": results}, ensure_ascii=False))
+        return 0
+
+    print(f"Профиль {args.profile}, карт: {results[0]['cards']}\n")
+    print(f"  {'вариант':<11} {'среднее':>9} {'первая':>9} {'p95':>9} {'пик RSS':>10} {'файл':>9} {'PSNR':>7}")
+    for r in results:
+        psnr_txt = "—" if r["min_psnr_vs_classic_db"] is None else f"{r['min_psnr_vs_classic_db']:.1f}"
+        print(
+            f"  {r['mode']:<11} {r['avg_ms']:>6.1f} ms {r['first_ms']:>6.1f} ms {r['p95_ms']:>6.1f} ms "
+            f"{r['peak_rss_mb']:>7.1f} MB {r['avg_kb']:>6.1f} KB {psnr_txt:>7}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
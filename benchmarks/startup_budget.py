@@ -0,0 +1,84 @@
+"""
+Регрессионный бенчмарк запуска: время от старта процесса до первого getUpdates.
+
+    python benchmarks/startup_budget.py [--runs 5] [--budget-ms 4000]
+
+Поднимает поддельный Bot API (benchmarks/fake_telegram.py), несколько раз запускает
+`python -m app.bot --startup-report=json --startup-only` и сравнивает медиану с бюджетом.
+Код выхода 1, если бюджет превышен. Бюджет можно задать и через STARTUP_BUDGET_MS.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+from fake_telegram import FakeTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def _one_run(api_url: str) -> tuple[dict, float]:
+    env = {
+        **os.environ,
+        "TG_API_SERVER": api_url,
+        "TG_BOT_TOKEN": os.environ.get("TG_BOT_TOKEN") or "1:startup-bench",
+        "BOT_MODE": "polling",
+    }
+    started = time.perf_counter()
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "app.bot", "--startup-report=json", "--startup-only",
+        cwd=ROOT, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await asyncio.wait_for(proc.communicate(), timeout=120)
+    wall = (time.perf_counter() - started) * 1000
+    for line in reversed(stderr.decode(errors="replace").splitlines()):
+        if line.startswith("{") and "time_to_first_poll_ms" in line:
+            return json.loads(line), wall
+    raise RuntimeError(f"бот не дошёл до первого getUpdates (код {proc.returncode}):\n{stderr.decode(errors='replace')[-2000:]}")
+
+
+async def run(runs: int) -> tuple[list[dict], list[float]]:
+    api = FakeTelegram()
+    await api.start()
+    try:
+        reports, walls = [], []
+        for _ in range(runs):
+            report, wall = await _one_run(api.url)
+            reports.append(report)
+            walls.append(wall)
+        return reports, walls
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бюджет времени запуска бота")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "").strip() or 4000))
+    args = parser.parse_args()
+
+    reports, walls = asyncio.run(run(args.runs))
+
+    phases = {}
+    for report in reports:
+        for name, ms in report["phases_ms"].items():
+            phases.setdefault(name, []).append(ms)
+    width = max(len(name) for name in phases)
+    print(f"Медиана по {args.runs} запускам:")
+    for name, values in phases.items():
+        print(f"  {name:<{width}}  {statistics.median(values):>8.1f} ms")
+    first_poll = statistics.median(r["time_to_first_poll_ms"] for r in reports)
+    print(f"  {'time to first poll':<{width}}  {first_poll:>8.1f} ms  (бюджет {args.budget_ms:.0f} ms)")
+    print(f"  {'wall clock (spawn → exit)':<{width}}  {statistics.median(walls):>8.1f} ms")
+
+    if first_poll > args.budget_ms:
+        print(f"FAIL: запуск на {first_poll - args.budget_ms:.0f} ms дольше бюджета")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()